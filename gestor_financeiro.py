@@ -1,44 +1,898 @@
+import time
+_INICIO = time.perf_counter()  # para --medir-arranque
+
 import tkinter as tk
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 from tkinter import messagebox, filedialog
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+from bisect import bisect_left, bisect_right
+from array import array
 import json
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
+import os
+import queue
+import sqlite3
+import sys
+import threading
+
+# O reportlab e o NumPy só são importados na primeira utilização
+# (exportar_pdf / somas vetorizadas), para a janela abrir mais depressa.
+_TEMPO_IMPORTS = time.perf_counter() - _INICIO
+
+
+# ========== Armazenamento ==========
+ARMAZENAMENTO = "json"  # "json" (snapshot + diário) ou "sqlite"
+FICHEIRO_DADOS = "orcamento.json"
+FICHEIRO_DIARIO = "orcamento.diario.jsonl"
+FICHEIRO_SQLITE = "orcamento.sqlite3"
+FICHEIRO_DADOS_ANTIGO = "data.json"  # formato antigo, com datas ISO; só lido se não houver FICHEIRO_DADOS
+LIMITE_DIARIO = 500  # eventos no diário antes de compactar num snapshot
+ATRASO_GRAVACAO = 0.5  # segundos sem alterações antes de gravar em disco
+ESPERA_MAXIMA_GRAVACAO = 3.0  # nunca adiar uma gravação mais do que isto
+LIMIAR_NUMPY = 50_000  # linhas a partir das quais compensa importar o NumPy
 
 
 # ========== Funções utilitárias ==========
-def salvar_dados(plafond_mensal, orcamento_semanal, gastos):
+_np = None
+
+
+def _numpy():
+    """
+    Importa o NumPy (opcional) na primeira soma vetorizada; None se não estiver instalado.
+    """
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:  # sem NumPy as somas por coluna usam ciclos em Python
+            _np = False
+    return _np or None
+
+
+def _gasto_para_json(g):
+    return {"id": g["id"], "data": g["data"].strftime("%d/%m/%Y"),
+            "valor": g["valor"], "motivo": g["motivo"]}
+
+
+def _ler_data(texto):
+    # Caminho rápido para "dd/mm/aaaa" (strptime domina o tempo de carga).
+    if len(texto) == 10 and texto[2] == texto[5] == "/":
+        try:
+            return datetime(int(texto[6:]), int(texto[3:5]), int(texto[:2]))
+        except ValueError:
+            pass
+    try:
+        return datetime.strptime(texto, "%d/%m/%Y")
+    except ValueError:
+        return datetime.fromisoformat(texto)
+
+
+def _gasto_de_json(g):
+    return {
+        "id": g.get("id"),  # None em ficheiros antigos; atribuído ao carregar
+        "data": _ler_data(g["data"]),
+        "valor": g["valor"],
+        "motivo": g["motivo"],
+    }
+
+
+def salvar_dados(plafond_mensal, orcamento_semanal, gastos, seq=0):
+    """
+    Grava o snapshot completo e esvazia o diário (compactação).
+    """
     dados = {
         "plafond_mensal": plafond_mensal,
         "orcamento_semanal": orcamento_semanal,
-        "gastos": [
-            {"data": g["data"].strftime(
-                "%d/%m/%Y"), "valor": g["valor"], "motivo": g["motivo"]}
-            for g in gastos
-        ],
+        "seq": seq,
+        "gastos": [_gasto_para_json(g) for g in gastos],
     }
-    with open("orcamento.json", "w", encoding="utf-8") as f:
+    temporario = FICHEIRO_DADOS + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
         json.dump(dados, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, FICHEIRO_DADOS)
+    # Os eventos com seq <= ao do snapshot são ignorados ao carregar, por isso
+    # uma falha entre o replace e o truncate não duplica registos.
+    open(FICHEIRO_DIARIO, "w", encoding="utf-8").close()
 
 
-def carregar_dados():
+def linha_diario(seq, operacao, gasto):
+    """
+    Formata um evento ("adicionar" ou "eliminar") do diário.
+    A eliminação só precisa do id do gasto.
+    """
+    if operacao == "eliminar":
+        registo = {"seq": seq, "op": operacao, "id": gasto["id"]}
+    else:
+        registo = {"seq": seq, "op": operacao, **_gasto_para_json(gasto)}
+    return json.dumps(registo, ensure_ascii=False) + "\n"
+
+
+def acrescentar_diario(linhas):
+    """
+    Acrescenta eventos ao diário numa só escrita, sem reescrever o histórico.
+    """
+    with open(FICHEIRO_DIARIO, "a", encoding="utf-8") as f:
+        f.write("".join(linhas))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class GravadorDiferido:
+    """
+    Grava o diário numa thread própria para a interface nunca esperar pelo
+    disco. As alterações feitas dentro da janela de atraso juntam-se numa só
+    escrita; uma compactação pendente absorve os eventos que já inclui.
+    fechar() grava tudo o que faltar antes de devolver.
+    """
+
+    def __init__(self, atraso=ATRASO_GRAVACAO, espera_maxima=ESPERA_MAXIMA_GRAVACAO):
+        self.atraso = atraso
+        self.espera_maxima = espera_maxima
+        self.condicao = threading.Condition()
+        self.linhas = []        # [(seq, linha)] ainda por gravar
+        self.snapshot = None    # (plafond, semanal, gastos, seq) por gravar
+        self.primeiro = self.ultimo = 0.0
+        self.a_fechar = False
+        self.erro = None
+        self.thread = threading.Thread(target=self._correr, daemon=True)
+        self.thread.start()
+
+    def _pendente(self):
+        agora = time.monotonic()
+        if not (self.linhas or self.snapshot):
+            self.primeiro = agora
+        self.ultimo = agora
+        self.condicao.notify()
+
+    def registar(self, seq, linha):
+        with self.condicao:
+            self._pendente()
+            self.linhas.append((seq, linha))
+
+    def compactar(self, plafond_mensal, orcamento_semanal, gastos, seq):
+        with self.condicao:
+            self._pendente()
+            self.snapshot = (plafond_mensal, orcamento_semanal, gastos, seq)
+
+    def _correr(self):
+        while True:
+            with self.condicao:
+                while not (self.linhas or self.snapshot or self.a_fechar):
+                    self.condicao.wait()
+                while not self.a_fechar:
+                    prazo = min(self.ultimo + self.atraso, self.primeiro + self.espera_maxima)
+                    espera = prazo - time.monotonic()
+                    if espera <= 0:
+                        break
+                    self.condicao.wait(espera)
+                linhas, self.linhas = self.linhas, []
+                snapshot, self.snapshot = self.snapshot, None
+                if self.a_fechar and not (linhas or snapshot):
+                    return
+            try:
+                self._gravar(linhas, snapshot)
+                self.erro = None
+            except OSError as e:
+                # Volta a pôr tudo na fila; tenta de novo na próxima janela.
+                self.erro = e
+                with self.condicao:
+                    self.linhas[:0] = linhas
+                    self.snapshot = self.snapshot or snapshot
+                    if self.a_fechar:
+                        return
+                time.sleep(self.atraso)
+
+    @staticmethod
+    def _gravar(linhas, snapshot):
+        if snapshot:
+            salvar_dados(*snapshot)
+            linhas = [(seq, linha) for seq, linha in linhas if seq > snapshot[3]]
+        if linhas:
+            acrescentar_diario(linha for _, linha in linhas)
+
+    def fechar(self):
+        with self.condicao:
+            self.a_fechar = True
+            self.condicao.notify()
+        self.thread.join()
+        if self.erro:
+            raise self.erro
+
+
+def _repetir_diario(gastos, seq):
+    """
+    Aplica aos gastos (dicionário id -> gasto) os eventos do diário posteriores
+    ao snapshot. Devolve o último seq e o número de eventos aplicados.
+    """
+    eventos = 0
+    proximo_id = max(gastos, default=0) + 1
     try:
-        with open("orcamento.json", "r", encoding="utf-8") as f:
-            dados = json.load(f)
-            gastos = [
-                {
-                    "data": datetime.strptime(g["data"], "%d/%m/%Y"),
-                    "valor": g["valor"],
-                    "motivo": g["motivo"],
-                }
-                for g in dados["gastos"]
-            ]
-            return dados["plafond_mensal"], dados["orcamento_semanal"], gastos
+        with open(FICHEIRO_DIARIO, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    registo = json.loads(linha)
+                except json.JSONDecodeError:
+                    break  # última linha incompleta (escrita interrompida)
+                if registo["seq"] <= seq:
+                    continue
+                if registo["op"] == "adicionar":
+                    gasto = _gasto_de_json(registo)
+                    if gasto["id"] is None:
+                        gasto["id"] = proximo_id
+                    proximo_id = max(proximo_id, gasto["id"] + 1)
+                    gastos[gasto["id"]] = gasto
+                elif "id" in registo:
+                    gastos.pop(registo["id"], None)
+                else:
+                    # Diário antigo, sem ids: elimina o primeiro gasto igual.
+                    gasto = _gasto_de_json(registo)
+                    for id_, g in gastos.items():
+                        if (g["data"], g["valor"], g["motivo"]) == (gasto["data"], gasto["valor"], gasto["motivo"]):
+                            del gastos[id_]
+                            break
+                seq = registo["seq"]
+                eventos += 1
     except FileNotFoundError:
-        return 0, 0, []
+        pass
+    return seq, eventos
+
+
+def carregar_dados():
+    """
+    Lê o snapshot e repete o diário por cima dele. Sem snapshot, importa o
+    ficheiro do formato antigo (data.json), se existir.
+    Devolve (plafond_mensal, orcamento_semanal, gastos, seq, eventos_no_diario).
+    """
+    for caminho in (FICHEIRO_DADOS, FICHEIRO_DADOS_ANTIGO):
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        return 0, 0, [], 0, 0
+    lidos = [_gasto_de_json(g) for g in dados["gastos"]]
+    gastos = {g["id"]: g for g in lidos if g["id"] is not None}
+    proximo_id = max(gastos, default=0) + 1
+    for g in lidos:
+        if g["id"] is None:
+            g["id"] = proximo_id
+            proximo_id += 1
+            gastos[g["id"]] = g
+    seq, eventos = _repetir_diario(gastos, dados.get("seq", 0))
+    return dados["plafond_mensal"], dados["orcamento_semanal"], list(gastos.values()), seq, eventos
+
+
+def periodo_semana(hoje):
+    """
+    Últimos 7 dias, incluindo hoje.
+    """
+    return hoje.date() - timedelta(days=6), hoje.date()
+
+
+def periodo_mes(hoje):
+    inicio = hoje.date().replace(day=1)
+    proximo = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio, proximo - timedelta(days=1)
+
+
+def periodo_trimestre(hoje):
+    mes_inicial = 3 * ((hoje.month - 1) // 3) + 1
+    inicio = hoje.date().replace(month=mes_inicial, day=1)
+    _, fim = periodo_mes(datetime(hoje.year, mes_inicial + 2, 1))
+    return inicio, fim
+
+
+def _agregar_por_dia(dias, valores):
+    """
+    Agrega as colunas (dias, valores) em {ordinal: (despesas, ganhos, n)}.
+    """
+    np = _numpy() if len(dias) >= LIMIAR_NUMPY else None
+    if np is None:
+        agregado = {}
+        for dia, valor in zip(dias, valores):
+            despesas, ganhos, n = agregado.get(dia, (0.0, 0.0, 0))
+            if valor > 0:
+                despesas += valor
+            else:
+                ganhos -= valor
+            agregado[dia] = (despesas, ganhos, n + 1)
+        return agregado
+    d = np.frombuffer(dias, dtype=np.intc)
+    v = np.frombuffer(valores, dtype=np.float64)
+    unicos, inverso, contagens = np.unique(d, return_inverse=True, return_counts=True)
+    despesas = np.bincount(inverso, weights=np.where(v > 0, v, 0.0), minlength=len(unicos))
+    ganhos = np.bincount(inverso, weights=np.where(v > 0, 0.0, -v), minlength=len(unicos))
+    return {int(u): (float(a), float(b), int(n))
+            for u, a, b, n in zip(unicos, despesas, ganhos, contagens)}
+
+
+class TotaisPorDia:
+    """
+    Despesas e ganhos por dia, indexados por ordinal da data em duas árvores
+    de Fenwick: adicionar/eliminar e a soma de qualquer intervalo de datas
+    (semana, mês, trimestre ou personalizado) custam O(log n).
+    """
+
+    def __init__(self, dias=None):
+        self.dias = dias or {}  # ordinal -> (despesas, ganhos, n), usado para reconstruir as árvores
+        self._reconstruir()
+
+    @classmethod
+    def de_colunas(cls, dias, valores):
+        return cls(_agregar_por_dia(dias, valores))
+
+    def _acumular(self, gasto, sinal):
+        dia = gasto["data"].toordinal()
+        despesas, ganhos, n = self.dias.get(dia, (0.0, 0.0, 0))
+        despesa = ganho = 0.0
+        if gasto["valor"] > 0:
+            despesa = sinal * gasto["valor"]
+        else:
+            ganho = -sinal * gasto["valor"]
+        n += sinal
+        if n:
+            self.dias[dia] = (despesas + despesa, ganhos + ganho, n)
+        else:
+            del self.dias[dia]
+        return dia, despesa, ganho
+
+    def _reconstruir(self):
+        """
+        Reconstrói as árvores em O(tamanho) quando aparece um dia fora do intervalo coberto.
+        """
+        dias = self.dias or {date.today().toordinal(): None}
+        self.origem = min(dias) - 1
+        self.tamanho = 64
+        while self.tamanho < 2 * (max(dias) - self.origem):
+            self.tamanho *= 2
+        self.despesas = [0.0] * (self.tamanho + 1)
+        self.ganhos = [0.0] * (self.tamanho + 1)
+        for dia, (despesas, ganhos, _) in self.dias.items():
+            self.despesas[dia - self.origem] = despesas
+            self.ganhos[dia - self.origem] = ganhos
+        for i in range(1, self.tamanho + 1):
+            j = i + (i & -i)
+            if j <= self.tamanho:
+                self.despesas[j] += self.despesas[i]
+                self.ganhos[j] += self.ganhos[i]
+
+    def somar(self, gasto, sinal=1):
+        dia, despesa, ganho = self._acumular(gasto, sinal)
+        i = dia - self.origem
+        if not 1 <= i <= self.tamanho:
+            self._reconstruir()
+            return
+        while i <= self.tamanho:
+            self.despesas[i] += despesa
+            self.ganhos[i] += ganho
+            i += i & -i
+
+    def subtrair(self, gasto):
+        self.somar(gasto, -1)
+
+    def _prefixo(self, dia):
+        i = min(dia - self.origem, self.tamanho)
+        despesas = ganhos = 0.0
+        while i > 0:
+            despesas += self.despesas[i]
+            ganhos += self.ganhos[i]
+            i -= i & -i
+        return despesas, ganhos
+
+    def totais(self, inicio, fim):
+        """
+        Devolve (despesas, ganhos) entre as datas inicio e fim, inclusive.
+        """
+        if fim < inicio:
+            return 0.0, 0.0
+        despesas_fim, ganhos_fim = self._prefixo(fim.toordinal())
+        despesas_ini, ganhos_ini = self._prefixo(inicio.toordinal() - 1)
+        return despesas_fim - despesas_ini, ganhos_fim - ganhos_ini
+
+
+# ========== Exportação PDF ==========
+def gerar_pdf(caminho, cabecalho, gastos, progresso, cancelar, intervalo_progresso=200):
+    """
+    Desenha o PDF página a página a partir de um iterador de gastos já
+    ordenado, sem o materializar. Pensado para correr fora da thread da
+    interface: chama progresso(linhas_feitas) de tempos a tempos e desiste,
+    sem gravar o ficheiro, quando o evento cancelar é ativado.
+    Devolve True se o PDF foi gravado.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(caminho, pagesize=A4)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(2 * cm, 27 * cm, "Resumo Mensal - Gestor de Orçamento")
+    c.setFont("Helvetica", 12)
+    y = 25 * cm
+
+    def escrever(texto, fonte="Helvetica"):
+        nonlocal y
+        c.setFont(fonte, 12)
+        c.drawString(2 * cm, y, texto)
+        y -= 0.6 * cm
+        if y < 2 * cm:
+            c.showPage()
+            y = 27 * cm
+
+    for linha in cabecalho:
+        if linha is None:
+            y -= 0.6 * cm
+        else:
+            escrever(linha[1], linha[0])
+
+    feitos = 0
+    try:
+        for feitos, g in enumerate(gastos, 1):
+            escrever(f"{g['data'].strftime('%d/%m/%Y')} - {g['motivo']} — {abs(g['valor']):,.2f} Kz")
+            if feitos % intervalo_progresso == 0:
+                if cancelar.is_set():
+                    return False
+                progresso(feitos)
+    finally:
+        # Fecha já o gerador (e a ligação SQLite dele) nesta mesma thread.
+        if hasattr(gastos, "close"):
+            gastos.close()
+    progresso(feitos)
+    if cancelar.is_set():
+        return False
+    c.save()
+    return True
+
+
+# ========== Livros (motores de armazenamento) ==========
+class InstantaneoColunas:
+    """
+    Cópia das colunas de um LivroJSON. Cada iteração volta ao início, por
+    isso uma compactação que falhe pode ser gravada de novo com os mesmos dados.
+    """
+
+    def __init__(self, dias, ids, valores, codigos, motivos):
+        self.dias, self.ids, self.valores = dias, ids, valores
+        self.codigos, self.motivos = codigos, motivos
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield {"id": self.ids[i], "data": datetime.fromordinal(self.dias[i]),
+                   "valor": self.valores[i], "motivo": self.motivos[self.codigos[i]]}
+
+
+class LivroJSON:
+    """
+    Livro em memória, persistido em snapshot JSON + diário append-only.
+
+    Os gastos ficam em colunas compactas (array do módulo array), sempre
+    ordenadas por (dia, id): dias em int32, ids em int64, valores em float64
+    e motivos como códigos de uma tabela de strings internadas. Inserção e
+    eliminação são por bisseção; os dicionários de gasto só são criados
+    quando a interface os pede (obter, intervalo, listar).
+    """
+
+    def __init__(self):
+        (self.plafond_mensal, self.orcamento_semanal, gastos,
+         self.seq, self.eventos_diario) = carregar_dados()
+        self.gravador = GravadorDiferido()
+        # O snapshot já vem por ordem cronológica, por isso este sort é linear.
+        gastos.sort(key=lambda g: (g["data"], g["id"]))
+        self.motivos = []         # código -> motivo
+        self.codigo_motivo = {}   # motivo -> código
+        self.dias = array("i", (g["data"].toordinal() for g in gastos))
+        self.ids = array("q", (g["id"] for g in gastos))
+        self.valores = array("d", (g["valor"] for g in gastos))
+        self.codigos = array("i", (self._codigo(g["motivo"]) for g in gastos))
+        del gastos
+        self.proximo_id = max(self.ids, default=0) + 1
+        self.por_dia = TotaisPorDia.de_colunas(self.dias, self.valores)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _codigo(self, motivo):
+        codigo = self.codigo_motivo.get(motivo)
+        if codigo is None:
+            codigo = self.codigo_motivo[sys.intern(motivo)] = len(self.motivos)
+            self.motivos.append(motivo)
+        return codigo
+
+    def _gasto(self, i):
+        return {"id": self.ids[i], "data": datetime.fromordinal(self.dias[i]),
+                "valor": self.valores[i], "motivo": self.motivos[self.codigos[i]]}
+
+    def _registar(self, operacao, gasto):
+        self.seq += 1
+        self.gravador.registar(self.seq, linha_diario(self.seq, operacao, gasto))
+        self.eventos_diario += 1
+        if self.eventos_diario >= LIMITE_DIARIO:
+            self.compactar()
+
+    def compactar(self):
+        _, gastos = self.instantaneo()
+        self.gravador.compactar(self.plafond_mensal, self.orcamento_semanal, gastos, self.seq)
+        self.eventos_diario = 0
+
+    def definir_orcamentos(self, plafond_mensal, orcamento_semanal):
+        self.plafond_mensal = plafond_mensal
+        self.orcamento_semanal = orcamento_semanal
+        self.compactar()
+
+    def adicionar(self, data, valor, motivo):
+        gasto = {"id": self.proximo_id, "data": data, "valor": valor, "motivo": motivo}
+        self.proximo_id += 1
+        # O id novo é o maior de todos, por isso fica no fim do seu dia.
+        i = bisect_right(self.dias, data.toordinal())
+        self.dias.insert(i, data.toordinal())
+        self.ids.insert(i, gasto["id"])
+        self.valores.insert(i, valor)
+        self.codigos.insert(i, self._codigo(motivo))
+        self.por_dia.somar(gasto)
+        self._registar("adicionar", gasto)
+        return gasto
+
+    def eliminar(self, gasto):
+        i = self.posicao(gasto, recentes_primeiro=False)
+        if i == len(self.ids) or self.ids[i] != gasto["id"]:
+            return  # já eliminado: tal como o DELETE do LivroSQLite, não faz nada
+        gasto = self._gasto(i)
+        del self.dias[i], self.ids[i], self.valores[i], self.codigos[i]
+        self.por_dia.subtrair(gasto)
+        self._registar("eliminar", gasto)
+
+    def totais(self, inicio, fim):
+        return self.por_dia.totais(inicio, fim)
+
+    def totais_por_motivo(self, inicio, fim):
+        """
+        Devolve {motivo: total líquido} entre as datas inicio e fim, inclusive,
+        do maior para o menor. Com NumPy a soma é vetorizada sobre as colunas.
+        """
+        lo = bisect_left(self.dias, inicio.toordinal())
+        hi = bisect_right(self.dias, fim.toordinal())
+        np = _numpy() if hi - lo >= LIMIAR_NUMPY else None
+        if np is not None:
+            codigos = np.frombuffer(self.codigos, dtype=np.intc)[lo:hi]
+            valores = np.frombuffer(self.valores, dtype=np.float64)[lo:hi]
+            somas = np.bincount(codigos, weights=valores, minlength=len(self.motivos))
+            usados = np.unique(codigos)
+            totais = {self.motivos[c]: float(somas[c]) for c in usados}
+            del codigos, valores  # liberta os buffers para os arrays poderem crescer
+        else:
+            totais = {}
+            for i in range(lo, hi):
+                motivo = self.motivos[self.codigos[i]]
+                totais[motivo] = totais.get(motivo, 0.0) + self.valores[i]
+        return dict(sorted(totais.items(), key=lambda x: x[1], reverse=True))
+
+    def listar(self, recentes_primeiro=True):
+        indices = range(len(self.ids) - 1, -1, -1) if recentes_primeiro else range(len(self.ids))
+        return map(self._gasto, indices)
+
+    def obter(self, indice, recentes_primeiro=True):
+        if recentes_primeiro:
+            indice = len(self.ids) - 1 - indice
+        return self._gasto(indice)
+
+    def intervalo(self, inicio, n, recentes_primeiro=True):
+        """
+        Devolve até n gastos a partir da posição inicio da listagem.
+        """
+        if recentes_primeiro:
+            fim = max(len(self.ids) - inicio, 0)
+            indices = range(fim - 1, max(fim - n, 0) - 1, -1)
+        else:
+            indices = range(inicio, min(inicio + n, len(self.ids)))
+        return [self._gasto(i) for i in indices]
+
+    def instantaneo(self):
+        """
+        Devolve (total, iterável cronológico) sobre uma cópia das colunas,
+        que pode ser percorrido noutra thread enquanto o livro muda.
+        """
+        copia = InstantaneoColunas(self.dias[:], self.ids[:], self.valores[:],
+                                   self.codigos[:], self.motivos[:])
+        return len(copia), copia
+
+    def posicao(self, gasto, recentes_primeiro=True):
+        dia = gasto["data"].toordinal()
+        lo = bisect_left(self.dias, dia)
+        hi = bisect_right(self.dias, dia, lo)
+        # Dentro do mesmo dia os ids estão por ordem crescente.
+        i = bisect_left(self.ids, gasto["id"], lo, hi)
+        return len(self.ids) - 1 - i if recentes_primeiro else i
+
+    def fechar(self):
+        self.gravador.fechar()
+
+
+class LivroSQLite:
+    """
+    Livro em SQLite (modo WAL), com índices por dia e por tipo (sinal do valor).
+    Totais, listagem e eliminação são consultas; o histórico não é carregado no arranque.
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS config (
+            chave TEXT PRIMARY KEY,
+            valor REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS gastos (
+            id INTEGER PRIMARY KEY,
+            dia INTEGER NOT NULL,
+            valor REAL NOT NULL,
+            motivo TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_gastos_dia ON gastos(dia);
+        CREATE INDEX IF NOT EXISTS idx_gastos_tipo ON gastos(valor > 0, dia, valor);
+    """
+
+    def __init__(self, caminho=FICHEIRO_SQLITE):
+        self.caminho = caminho
+        self.conn = sqlite3.connect(caminho)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.ESQUEMA)
+        # A importação grava a config na mesma transação que os gastos: config
+        # vazia quer dizer que nunca foi importado (ou que a importação falhou).
+        if not self.conn.execute("SELECT 1 FROM config LIMIT 1").fetchone():
+            self._importar_json()
+        self.plafond_mensal = self._config("plafond_mensal")
+        self.orcamento_semanal = self._config("orcamento_semanal")
+
+    def _config(self, chave):
+        linha = self.conn.execute(
+            "SELECT valor FROM config WHERE chave = ?", (chave,)).fetchone()
+        return linha[0] if linha else 0
+
+    def _importar_json(self):
+        """
+        Primeira execução: importa o mesmo histórico que o LivroJSON vê
+        (orcamento.json + diário, ou data.json se for o único que existe),
+        numa só transação com a config e a marca "importado".
+        """
+        plafond, semanal, gastos, _, _ = carregar_dados()
+        gastos.sort(key=lambda g: (g["data"], g["id"]))
+        with self.conn:
+            self._gravar_config(plafond, semanal)
+            self.conn.execute("INSERT OR REPLACE INTO config (chave, valor) VALUES ('importado', 1)")
+            self.conn.executemany(
+                "INSERT INTO gastos (id, dia, valor, motivo) VALUES (?, ?, ?, ?)",
+                [(g["id"], g["data"].toordinal(), g["valor"], g["motivo"]) for g in gastos])
+
+    def _gravar_config(self, plafond_mensal, orcamento_semanal):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO config (chave, valor) VALUES (?, ?)",
+            [("plafond_mensal", plafond_mensal), ("orcamento_semanal", orcamento_semanal)])
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM gastos").fetchone()[0]
+
+    def definir_orcamentos(self, plafond_mensal, orcamento_semanal):
+        self.plafond_mensal = plafond_mensal
+        self.orcamento_semanal = orcamento_semanal
+        with self.conn:
+            self._gravar_config(plafond_mensal, orcamento_semanal)
+
+    def adicionar(self, data, valor, motivo):
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO gastos (dia, valor, motivo) VALUES (?, ?, ?)",
+                (data.toordinal(), valor, motivo))
+        return {"id": cur.lastrowid, "data": data, "valor": valor, "motivo": motivo}
+
+    def eliminar(self, gasto):
+        with self.conn:
+            self.conn.execute("DELETE FROM gastos WHERE id = ?", (gasto["id"],))
+
+    def totais(self, inicio, fim):
+        """
+        Devolve (despesas, ganhos) entre as datas inicio e fim, inclusive.
+        """
+        consulta = "SELECT TOTAL(valor) FROM gastos WHERE (valor > 0) = ? AND dia BETWEEN ? AND ?"
+        intervalo = (inicio.toordinal(), fim.toordinal())
+        despesas = self.conn.execute(consulta, (1, *intervalo)).fetchone()[0]
+        ganhos = abs(self.conn.execute(consulta, (0, *intervalo)).fetchone()[0])
+        return despesas, ganhos
+
+    def totais_por_motivo(self, inicio, fim):
+        """
+        Devolve {motivo: total líquido} entre as datas inicio e fim, inclusive,
+        do maior para o menor.
+        """
+        cur = self.conn.execute(
+            "SELECT motivo, TOTAL(valor) AS total FROM gastos WHERE dia BETWEEN ? AND ? "
+            "GROUP BY motivo ORDER BY total DESC", (inicio.toordinal(), fim.toordinal()))
+        return dict(cur.fetchall())
+
+    @staticmethod
+    def _gasto(linha):
+        return {"id": linha[0], "data": datetime.fromordinal(linha[1]),
+                "valor": linha[2], "motivo": linha[3]}
+
+    # "Recentes primeiro" é exatamente a ordem cronológica invertida
+    # (no mesmo dia, o último registado aparece primeiro).
+    def listar(self, recentes_primeiro=True):
+        ordem = "dia DESC, id DESC" if recentes_primeiro else "dia, id"
+        cur = self.conn.execute(
+            f"SELECT id, dia, valor, motivo FROM gastos ORDER BY {ordem}")
+        return map(self._gasto, cur)
+
+    def obter(self, indice, recentes_primeiro=True):
+        return self.intervalo(indice, 1, recentes_primeiro)[0]
+
+    def intervalo(self, inicio, n, recentes_primeiro=True):
+        """
+        Devolve até n gastos a partir da posição inicio da listagem.
+        """
+        ordem = "dia DESC, id DESC" if recentes_primeiro else "dia, id"
+        cur = self.conn.execute(
+            f"SELECT id, dia, valor, motivo FROM gastos ORDER BY {ordem} LIMIT ? OFFSET ?",
+            (n, inicio))
+        return [self._gasto(linha) for linha in cur]
+
+    def instantaneo(self):
+        """
+        Devolve (total, iterador cronológico). O iterador abre a sua própria
+        ligação na thread que o percorre; em WAL a leitura vê um estado
+        consistente mesmo com escritas em curso.
+        """
+        def gerar():
+            conn = sqlite3.connect(self.caminho)
+            try:
+                for linha in conn.execute("SELECT id, dia, valor, motivo FROM gastos ORDER BY dia, id"):
+                    yield self._gasto(linha)
+            finally:
+                conn.close()
+        return len(self), gerar()
+
+    def posicao(self, gasto, recentes_primeiro=True):
+        if recentes_primeiro:
+            condicao = "dia > ? OR (dia = ? AND id > ?)"
+        else:
+            condicao = "dia < ? OR (dia = ? AND id < ?)"
+        dia = gasto["data"].toordinal()
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM gastos WHERE {condicao}", (dia, dia, gasto["id"])).fetchone()[0]
+
+    def fechar(self):
+        self.conn.close()
+
+
+def abrir_livro():
+    if ARMAZENAMENTO == "sqlite":
+        return LivroSQLite()
+    return LivroJSON()
+
+
+# ========== Componentes ==========
+class ListaVirtual(tb.Frame):
+    """
+    Listbox virtualizada: só formata e mostra as linhas visíveis, pedindo-as
+    ao livro à medida que se faz scroll. Inserir ou remover um gasto mexe
+    numa única linha em vez de reconstruir a lista.
+    """
+
+    def __init__(self, master, livro, formatar, altura=10, largura=90):
+        super().__init__(master)
+        self.livro = livro
+        self.formatar = formatar
+        self.altura = altura
+        self.topo = 0            # posição (na listagem) da primeira linha visível
+        self.selecionado = None  # posição absoluta do item selecionado
+
+        self.lista = tk.Listbox(self, height=altura, width=largura, exportselection=False)
+        self.lista.pack(side="left", fill="both", expand=True)
+        self.barra = tb.Scrollbar(self, orient="vertical", command=self._rolar_barra)
+        self.barra.pack(side="right", fill="y")
+
+        self.lista.bind("<<ListboxSelect>>", self._ao_selecionar)
+        self.lista.bind("<MouseWheel>", self._roda)
+        self.lista.bind("<Button-4>", lambda e: self._rolar(-3))
+        self.lista.bind("<Button-5>", lambda e: self._rolar(3))
+        self.lista.bind("<Up>", lambda e: self._mover_selecao(-1))
+        self.lista.bind("<Down>", lambda e: self._mover_selecao(1))
+
+    # ---- desenho ----
+    def recarregar(self):
+        self.topo = min(self.topo, max(len(self.livro) - self.altura, 0))
+        self._desenhar()
+
+    def _desenhar(self):
+        self.lista.delete(0, "end")
+        for g in self.livro.intervalo(self.topo, self.altura):
+            self.lista.insert("end", self.formatar(g))
+        self._marcar_selecao()
+        self._atualizar_barra()
+
+    def _marcar_selecao(self):
+        self.lista.selection_clear(0, "end")
+        if self.selecionado is not None and 0 <= self.selecionado - self.topo < self.altura:
+            self.lista.selection_set(self.selecionado - self.topo)
+
+    def _atualizar_barra(self):
+        total = len(self.livro)
+        if total <= self.altura:
+            self.barra.set(0, 1)
+        else:
+            self.barra.set(self.topo / total, (self.topo + self.altura) / total)
+
+    # ---- scroll ----
+    def _rolar(self, linhas):
+        topo = min(max(self.topo + linhas, 0), max(len(self.livro) - self.altura, 0))
+        if topo != self.topo:
+            self.topo = topo
+            self._desenhar()
+        return "break"
+
+    def _rolar_barra(self, acao, quantidade, unidade=None):
+        if acao == "moveto":
+            return self._rolar(int(float(quantidade) * len(self.livro)) - self.topo)
+        passo = self.altura if unidade == "pages" else 1
+        return self._rolar(int(quantidade) * passo)
+
+    def _roda(self, evento):
+        return self._rolar(-3 if evento.delta > 0 else 3)
+
+    def _mover_selecao(self, passo):
+        total = len(self.livro)
+        if total:
+            atual = self.topo - 1 if self.selecionado is None else self.selecionado
+            self.selecionado = min(max(atual + passo, 0), total - 1)
+            if self.selecionado < self.topo:
+                self.topo = self.selecionado
+            elif self.selecionado >= self.topo + self.altura:
+                self.topo = self.selecionado - self.altura + 1
+            self._desenhar()
+        return "break"
+
+    def _ao_selecionar(self, _evento):
+        selecao = self.lista.curselection()
+        self.selecionado = self.topo + selecao[0] if selecao else None
+
+    def indice_selecionado(self):
+        return self.selecionado
+
+    # ---- atualizações incrementais (chamadas depois de alterar o livro) ----
+    def inserir(self, posicao):
+        if self.selecionado is not None and posicao <= self.selecionado:
+            self.selecionado += 1
+        if posicao < self.topo:
+            self.topo += 1  # mantém as mesmas linhas no ecrã
+        elif posicao < self.topo + self.altura:
+            self.lista.insert(posicao - self.topo,
+                              self.formatar(self.livro.obter(posicao)))
+            if self.lista.size() > self.altura:
+                self.lista.delete(self.altura)
+            self._marcar_selecao()
+        self._atualizar_barra()
+
+    def remover(self, posicao):
+        if self.selecionado is not None:
+            if posicao == self.selecionado:
+                self.selecionado = None
+            elif posicao < self.selecionado:
+                self.selecionado -= 1
+        if posicao < self.topo:
+            self.topo -= 1
+        elif posicao < self.topo + self.altura:
+            self.lista.delete(posicao - self.topo)
+            seguinte = self.livro.intervalo(self.topo + self.altura - 1, 1)
+            if seguinte:
+                self.lista.insert("end", self.formatar(seguinte[0]))
+            elif self.topo > 0:
+                self.topo -= 1
+                self.lista.insert(0, self.formatar(self.livro.obter(self.topo)))
+            self._marcar_selecao()
+        self._atualizar_barra()
 
 
 # ========== Classe Principal ==========
@@ -48,13 +902,21 @@ class GestorOrcamento(tb.Window):
         self.geometry("850x640")
         self.resizable(False, False)
 
-        self.plafond_mensal, self.orcamento_semanal, self.gastos = carregar_dados()
+        self.livro = abrir_livro()
+        self.protocol("WM_DELETE_WINDOW", self._fechar)
 
-        if self.plafond_mensal == 0 or self.orcamento_semanal == 0:
+        if self.livro.plafond_mensal == 0 or self.livro.orcamento_semanal == 0:
             self._criar_tela_inicial()
         else:
             self._criar_dashboard_ui()
 
+    def _fechar(self):
+        try:
+            self.livro.fechar()
+        except OSError as e:
+            messagebox.showerror("Erro", f"Não foi possível gravar os dados:\n{e}")
+        self.destroy()
+
     # ========== Tela Inicial ==========
     def _criar_tela_inicial(self):
         frame = tb.Frame(self, padding=30)
@@ -76,13 +938,13 @@ class GestorOrcamento(tb.Window):
 
     def _salvar_iniciais(self):
         try:
-            self.plafond_mensal = float(self.entry_mensal.get())
-            self.orcamento_semanal = float(self.entry_semanal.get())
+            plafond_mensal = float(self.entry_mensal.get())
+            orcamento_semanal = float(self.entry_semanal.get())
         except ValueError:
             messagebox.showerror("Erro", "Insira valores numéricos válidos!")
             return
 
-        salvar_dados(self.plafond_mensal, self.orcamento_semanal, [])
+        self.livro.definir_orcamentos(plafond_mensal, orcamento_semanal)
         for widget in self.winfo_children():
             widget.destroy()
         self._criar_dashboard_ui()
@@ -143,7 +1005,7 @@ class GestorOrcamento(tb.Window):
                   command=self.exportar_pdf).grid(row=0, column=1, padx=10)
 
         # Lista de gastos/ganhos
-        self.lista = tk.Listbox(center, height=10, width=90)
+        self.lista = ListaVirtual(center, self.livro, self._formatar_linha)
         self.lista.pack(pady=10)
 
         # Botão de eliminar
@@ -162,11 +1024,11 @@ class GestorOrcamento(tb.Window):
             messagebox.showerror("Erro", "Insere valores válidos.")
             return
 
-        self.gastos.append({"data": data, "valor": valor, "motivo": motivo})
-        salvar_dados(self.plafond_mensal, self.orcamento_semanal, self.gastos)
+        gasto = self.livro.adicionar(data, valor, motivo)
         self.entry_valor.delete(0, "end")
         self.entry_motivo.delete(0, "end")
-        self.atualizar_tudo()
+        self.lista.inserir(self.livro.posicao(gasto))
+        self.atualizar_totais()
 
     def abrir_reposicao(self):
         popup = tb.Toplevel(self)
@@ -206,55 +1068,46 @@ class GestorOrcamento(tb.Window):
                     "Erro", "Insere valores válidos (data e número positivo).")
                 return
 
-            self.gastos.append({
-                "data": data,
-                "valor": -valor,
-                "motivo": f"💰 [Ganho] {desc}"
-            })
-            salvar_dados(self.plafond_mensal,
-                         self.orcamento_semanal, self.gastos)
+            gasto = self.livro.adicionar(data, -valor, f"💰 [Ganho] {desc}")
             popup.destroy()
-            self.atualizar_tudo()
+            self.lista.inserir(self.livro.posicao(gasto))
+            self.atualizar_totais()
 
         tb.Button(frm, text="Confirmar", bootstyle="success", command=confirmar).grid(
             row=3, column=0, columnspan=2, pady=14)
 
     def eliminar_item(self):
-        selecao = self.lista.curselection()
-        if not selecao:
+        indice = self.lista.indice_selecionado()
+        if indice is None:
             messagebox.showwarning(
                 "Aviso", "Seleciona um item da lista primeiro.")
             return
 
-        indice = selecao[0]
-        gasto_selecionado = sorted(
-            self.gastos, key=lambda x: x["data"], reverse=True)[indice]
+        gasto_selecionado = self.livro.obter(indice)
 
         confirmar = messagebox.askyesno(
             "Confirmar", f"Tens certeza que queres eliminar este item?\n\n{gasto_selecionado['motivo']} — {abs(gasto_selecionado['valor']):,.2f} Kz")
         if confirmar:
-            self.gastos.remove(gasto_selecionado)
-            salvar_dados(self.plafond_mensal,
-                         self.orcamento_semanal, self.gastos)
-            self.atualizar_tudo()
+            self.livro.eliminar(gasto_selecionado)
+            self.lista.remover(indice)
+            self.atualizar_totais()
             messagebox.showinfo(
                 "Eliminado", "O item foi removido com sucesso.")
 
     def atualizar_tudo(self):
+        self.atualizar_totais()
+        self.lista.recarregar()
+
+    def atualizar_totais(self):
         hoje = datetime.now()
-        total_mensal_gastos = sum(abs(
-            g["valor"]) for g in self.gastos if g["valor"] > 0 and g["data"].month == hoje.month)
-        total_mensal_ganhos = sum(abs(
-            g["valor"]) for g in self.gastos if g["valor"] < 0 and g["data"].month == hoje.month)
-        limite_semanal_inicio = hoje - timedelta(days=7)
-        total_semanal_gastos = sum(abs(
-            g["valor"]) for g in self.gastos if g["valor"] > 0 and g["data"] >= limite_semanal_inicio)
-        total_semanal_ganhos = sum(abs(
-            g["valor"]) for g in self.gastos if g["valor"] < 0 and g["data"] >= limite_semanal_inicio)
-
-        restante_mensal = max(self.plafond_mensal +
+        total_mensal_gastos, total_mensal_ganhos = self.livro.totais(
+            *periodo_mes(hoje))
+        total_semanal_gastos, total_semanal_ganhos = self.livro.totais(
+            *periodo_semana(hoje))
+
+        restante_mensal = max(self.livro.plafond_mensal +
                               total_mensal_ganhos - total_mensal_gastos, 0.0)
-        restante_semanal = max(self.orcamento_semanal +
+        restante_semanal = max(self.livro.orcamento_semanal +
                                total_semanal_ganhos - total_semanal_gastos, 0.0)
 
         self.label_plafond_mensal.config(
@@ -262,20 +1115,20 @@ class GestorOrcamento(tb.Window):
         self.label_semanal.config(
             text=f"Plafond semanal: {restante_semanal:,.2f} Kz")
 
-        self.lista.delete(0, "end")
-        for g in sorted(self.gastos, key=lambda x: x["data"], reverse=True):
-            tipo = "Despesa" if g["valor"] > 0 else "Ganho"
-            self.lista.insert(
-                "end", f"{g['data'].strftime('%d/%m/%Y')} - {g['motivo']} ({tipo}) — {abs(g['valor']):,.2f} Kz")
+    @staticmethod
+    def _formatar_linha(g):
+        tipo = "Despesa" if g["valor"] > 0 else "Ganho"
+        return f"{g['data'].strftime('%d/%m/%Y')} - {g['motivo']} ({tipo}) — {abs(g['valor']):,.2f} Kz"
 
     def mostrar_resumo_semanal(self):
-        hoje = datetime.now()
-        inicio_semana = hoje - timedelta(days=7)
-        gastos_semana = [g for g in self.gastos if g["data"] >= inicio_semana]
-        total = sum(abs(g["valor"]) if g["valor"] > 0 else -
-                    abs(g["valor"]) for g in gastos_semana)
+        semana = periodo_semana(datetime.now())
+        despesas, ganhos = self.livro.totais(*semana)
+        total = despesas - ganhos
+        por_motivo = list(self.livro.totais_por_motivo(*semana).items())[:5]
+        linhas = "\n".join(f"• {motivo}: {valor:,.2f} Kz" for motivo, valor in por_motivo if valor > 0)
         messagebox.showinfo(
-            "Resumo Semanal", f"Total líquido na semana: {total:,.2f} Kz")
+            "Resumo Semanal", f"Total líquido na semana: {total:,.2f} Kz"
+            + (f"\n\nMaiores despesas:\n{linhas}" if linhas else ""))
 
     def exportar_pdf(self):
         caminho = filedialog.asksaveasfilename(
@@ -283,24 +1136,101 @@ class GestorOrcamento(tb.Window):
         if not caminho:
             return
 
-        c = canvas.Canvas(caminho, pagesize=A4)
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(2 * cm, 27 * cm, "Resumo Mensal - Gestor de Orçamento")
-        c.setFont("Helvetica", 12)
-        y = 25 * cm
+        # Os totais são baratos e ficam calculados aqui; a listagem completa é
+        # desenhada numa thread a partir de um instantâneo do livro.
+        hoje = datetime.now()
+        cabecalho = []
+        for nome, periodo in (("Semana", periodo_semana(hoje)),
+                              ("Mês", periodo_mes(hoje)),
+                              ("Trimestre", periodo_trimestre(hoje))):
+            despesas, ganhos = self.livro.totais(*periodo)
+            cabecalho.append(
+                ("Helvetica", f"{nome}: despesas {despesas:,.2f} Kz — ganhos {ganhos:,.2f} Kz"))
+        cabecalho.append(None)
+        cabecalho.append(("Helvetica-Bold", "Por motivo (mês)"))
+        for motivo, total in self.livro.totais_por_motivo(*periodo_mes(hoje)).items():
+            cabecalho.append(("Helvetica", f"{motivo} — {total:,.2f} Kz"))
+        cabecalho.append(None)
+        total, gastos = self.livro.instantaneo()
 
-        for g in sorted(self.gastos, key=lambda x: x["data"]):
-            linha = f"{g['data'].strftime('%d/%m/%Y')} - {g['motivo']} — {abs(g['valor']):,.2f} Kz"
-            c.drawString(2 * cm, y, linha)
-            y -= 0.6 * cm
-            if y < 2 * cm:
-                c.showPage()
-                y = 27 * cm
-        c.save()
-        messagebox.showinfo("Sucesso", f"PDF salvo em:\n{caminho}")
+        popup = tb.Toplevel(self)
+        popup.title("A gerar PDF")
+        popup.geometry("380x150")
+        popup.resizable(False, False)
+
+        frm = tb.Frame(popup, padding=12)
+        frm.pack(fill="both", expand=True)
+        estado = tb.Label(frm, text="A preparar...")
+        estado.pack(pady=(0, 8))
+        barra = tb.Progressbar(frm, maximum=max(total, 1), length=320, bootstyle="warning")
+        barra.pack()
+
+        cancelar = threading.Event()
+        tb.Button(frm, text="Cancelar", bootstyle="danger-outline",
+                  command=cancelar.set).pack(pady=10)
+        popup.protocol("WM_DELETE_WINDOW", cancelar.set)
+
+        mensagens = queue.Queue()
+
+        def trabalhar():
+            try:
+                gravado = gerar_pdf(caminho, cabecalho, gastos,
+                                    lambda feitos: mensagens.put(("progresso", feitos)), cancelar)
+                mensagens.put(("fim", gravado))
+            except Exception as e:
+                mensagens.put(("erro", str(e)))
+
+        def acompanhar():
+            try:
+                while True:
+                    tipo, dado = mensagens.get_nowait()
+                    if tipo == "progresso":
+                        barra.configure(value=dado)
+                        estado.config(text=f"{dado:,} de {total:,} linhas")
+                        continue
+                    popup.destroy()
+                    if tipo == "erro":
+                        messagebox.showerror("Erro", f"Não foi possível gerar o PDF:\n{dado}")
+                    elif dado:
+                        messagebox.showinfo("Sucesso", f"PDF salvo em:\n{caminho}")
+                    return
+            except queue.Empty:
+                self.after(100, acompanhar)
+
+        threading.Thread(target=trabalhar, daemon=True).start()
+        acompanhar()
+
+
+# ========== Arranque ==========
+def relatorio_imports(n=15):
+    """
+    Corre "python -X importtime" sobre este módulo e mostra os n imports
+    mais caros (tempo cumulativo), como o relatório do próprio Python.
+    """
+    import subprocess
+
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import gestor_financeiro"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    linhas = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, modulo = linha.split("|")
+        linhas.append((int(cumulativo), modulo.rstrip()))
+    print(f"{'cumulativo (ms)':>16}  módulo")
+    for cumulativo, modulo in sorted(linhas, reverse=True)[:n]:
+        print(f"{cumulativo / 1000:16.1f}  {modulo}")
 
 
 # ========== Execução ==========
 if __name__ == "__main__":
+    if "--relatorio-imports" in sys.argv:
+        relatorio_imports()
+        sys.exit()
     app = GestorOrcamento()
+    if "--medir-arranque" in sys.argv:
+        app.after_idle(lambda: print(
+            f"Janela pronta em {(time.perf_counter() - _INICIO) * 1000:.0f} ms "
+            f"(imports: {_TEMPO_IMPORTS * 1000:.0f} ms)"))
     app.mainloop()
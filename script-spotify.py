@@ -4,11 +4,23 @@ import yt_dlp
 import os
 import shutil
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from util_downloads import (ArmazemConteudo, CacheMetadados, ControladorConcorrencia, DiarioLote,
+                            EstagioPosProcessamento, RegistoResultados, YoutubeDLPorThread,
+                            chave_canonica, chave_info, descarregar_com_cache, resumir_info,
+                            submeter_limitado, destino_sem_formato, expandir_playlist, juntar_em_mp4)
 
 # Configurações
 FFMPEG_PATH = r'C:\ffmpeg\ffmpeg-8.0-essentials_build\ffmpeg-8.0-essentials_build\bin'
 DOWNLOAD_DIR = os.path.join(os.path.expanduser('~'), 'Desktop', 'downloads')
+MAX_WORKERS = 20  # teto de downloads simultâneos (o limite real é adaptativo)
+WORKERS_INICIAIS = 4
+CACHE_METADADOS = '.cache_metadados.sqlite3'  # info dicts do yt_dlp, dentro de DOWNLOAD_DIR
+CACHE_TTL = 3 * 3600  # segundos; as URLs dos formatos do YouTube expiram ao fim de ~6h
+DIARIO_LOTE = '.lote_{}.jsonl'  # estado de cada item do lote, para retomar (dentro de DOWNLOAD_DIR)
+REGISTO_RESULTADOS = '.resultados.jsonl'  # resultados do último lote (dentro de DOWNLOAD_DIR)
 
 def create_download_dir():
     if os.path.exists(DOWNLOAD_DIR):
@@ -51,84 +63,157 @@ def parse_youtube_link(link):
     else:
         raise ValueError("Link inválido.")
 
-def get_playlist_videos(playlist_url):
+def get_playlist_videos(playlist_url, cache=None):
+    # Gerador: os vídeos saem à medida que as páginas da playlist chegam
     ydl_opts = {
         'extract_flat': True,
         'quiet': True,
     }
-    video_urls = []
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(playlist_url, download=False)
-            if 'entries' in info:
-                for entry in info['entries']:
-                    if entry and 'url' in entry:
-                        video_urls.append(f"https://www.youtube.com/watch?v={entry['url']}")
+            for entry in expandir_playlist(ydl, playlist_url, cache):
+                if entry.get('id'):
+                    yield f"https://www.youtube.com/watch?v={entry['id']}"
+                elif entry.get('url'):
+                    yield entry['url']
     except Exception as e:
         print(f"Erro ao extrair vídeos da playlist: {e}")
-    return video_urls
 
-def download_youtube_content(url, format_choice, idx=None, total=None):
-    # Opções para obter informações do vídeo
-    info_opts = {
-        'quiet': True,
-        'nocache': True,
-        'skip_download': True,
-    }
+def expand_links(links, cache=None):
+    # Gera os URLs dos vídeos a baixar, sem repetidos (youtu.be/x e watch?v=x contam como um),
+    # expandindo as playlists aos poucos
+    vistos = set()
+    for link in links:
+        try:
+            type_, uri = parse_youtube_link(link)
+        except Exception as e:
+            print(f"Link ignorado: {link} - {e}")
+            continue
+        if type_ == 'playlist':
+            print(f"Extraindo vídeos da playlist: {uri}")
+            videos = get_playlist_videos(uri, cache)
+        else:
+            videos = [uri]
+        encontrados = 0
+        for video in videos:
+            encontrados += 1
+            chave = chave_canonica(video)
+            if chave not in vistos:
+                vistos.add(chave)
+                yield video
+        if not encontrados:
+            print(f"Nenhum vídeo encontrado na playlist: {uri}")
+
+# YoutubeDL (só para o ffmpeg) de cada worker do EstagioPosProcessamento
+YDL_POS_PROCESSAMENTO = YoutubeDLPorThread({'quiet': True, 'ffmpeg_location': FFMPEG_PATH or None})
+# Deduplicação por conteúdo (hardlinks), partilhada com os outros downloaders
+ARMAZEM = ArmazemConteudo()
+
+def post_process_content(info, format_choice, title, ext, idx=None, total=None, diario=None):
+    # Etapa de CPU (ffmpeg): corre no EstagioPosProcessamento, um por núcleo
+    from yt_dlp.postprocessor import FFmpegExtractAudioPP, EmbedThumbnailPP, FFmpegMetadataPP
+    chave = chave_info(info)
     try:
-        with yt_dlp.YoutubeDL(info_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            title = info.get('title', 'Desconhecido')
-    except Exception:
-        title = 'Desconhecido'
+        ydl = YDL_POS_PROCESSAMENTO.obter()
+        if format_choice == 'mp3':
+            # A faixa só tem os campos que diferem do info dict (filepath, ext, ...):
+            # título, miniaturas e metadados vêm do info dict principal.
+            faixas = info.get('requested_downloads')
+            if faixas:
+                info = {**info, **faixas[0]}
+            info = ydl.run_pp(FFmpegExtractAudioPP(ydl, preferredcodec='mp3', preferredquality='192'), info)
+            info = ydl.run_pp(EmbedThumbnailPP(ydl), info)  # Embute a capa no MP3
+            info = ydl.run_pp(FFmpegMetadataPP(ydl), info)  # Mantém os metadados
+            caminho = info['filepath']
+        else:
+            caminho, plano, segundos = juntar_em_mp4(ydl, info, destino_sem_formato(info, 'mp4'))
+            print(f"({idx}/{total}) MP4 pronto em {segundos:.1f}s ({plano})")
+        original = ARMAZEM.registar(caminho)
+        if original != os.path.abspath(caminho):
+            print(f"({idx}/{total}) Conteúdo igual a {original}: substituído por hardlink")
+        if diario is not None:
+            diario.marcar(chave, 'concluido', ficheiro=caminho)
+        print(f"({idx}/{total}) Download concluído: {title}.{ext}")
+        return {'status': 'ok', 'url': info.get('webpage_url')}
+    except Exception as e:
+        if diario is not None:
+            diario.marcar(chave, 'falhou', erro=str(e))
+        print(f"Erro ao converter: {title} - {e}")
+        return {'status': 'error', 'url': info.get('webpage_url'), 'error': str(e)}
 
+def download_options(format_choice, controlador=None, diario=None):
+    # Só rede: conversão para MP3, capa e metadados/merge ficam para post_process_content.
+    # As opções são as mesmas para todos os vídeos do lote (um YoutubeDL por thread).
     if format_choice == 'mp3':
         ydl_opts = {
             'format': 'bestaudio/best',
             'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.%(ext)s'),
             'quiet': True,
             'nocache': True,
-            'postprocessors': [
-                {
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                },
-                {
-                    'key': 'EmbedThumbnail',  # Embute a capa no MP3
-                },
-                {
-                    'key': 'FFmpegMetadata',  # Mantém os metadados
-                }
-            ],
+            'writethumbnail': True,  # a capa é descarregada aqui e embutida depois
         }
-        ext = 'mp3'
     elif format_choice == 'mp4':
         ydl_opts = {
-            'format': 'bestvideo+bestaudio/best',
-            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.%(ext)s'),
+            # Vídeo e áudio em ficheiros separados (.f<format_id>), juntos depois
+            'format': 'bestvideo,bestaudio/best',
+            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.f%(format_id)s.%(ext)s'),
             'quiet': True,
             'nocache': True,
-            'merge_output_format': 'mp4',
         }
-        ext = 'mp4'
+    # Também aqui: o yt_dlp usa ffmpeg no download de HLS/DASH e nalguns fallbacks
     if FFMPEG_PATH:
         ydl_opts['ffmpeg_location'] = FFMPEG_PATH
+    ydl_opts['progress_hooks'] = [objeto.hook_progresso for objeto in (controlador, diario)
+                                  if objeto is not None]
+    return ydl_opts
+
+def download_youtube_content(url, format_choice, idx=None, total=None, controlador=None, estagio=None, cache=None, ydls=None, diario=None):
+    ext = format_choice
+    proprio = ydls is None
+    if proprio:
+        ydls = YoutubeDLPorThread(download_options(format_choice, controlador, diario))
+    if controlador is not None:
+        controlador.adquirir()
+
+    title = 'Desconhecido'
 
-    print(f"({idx}/{total}) Baixando: {title}.{ext} [{ext.upper()}]")
+    def anunciar(info):
+        nonlocal title
+        title = info.get('title', title)
+        print(f"({idx}/{total}) Baixando: {title}.{ext} [{ext.upper()}]")
 
+    erro = None
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        print(f"({idx}/{total}) Download concluído: {title}.{ext}")
+        if diario is not None:
+            diario.marcar(chave_canonica(url), 'a_descarregar')
+        ydl = ydls.obter()
+        # Uma única extração (ou nenhuma, com cache): o download reaproveita o resultado
+        info = descarregar_com_cache(ydl, url, cache, ao_extrair=anunciar)
+        if diario is not None:
+            diario.marcar(chave_info(info), 'pos_processamento', info=resumir_info(ydl, info), titulo=title)
     except Exception as e:
+        erro = e
+        if diario is not None:
+            diario.marcar(chave_canonica(url), 'falhou', erro=str(e))
         print(f"Erro ao baixar: {url} - {e}")
+        return {'status': 'error', 'url': url, 'error': str(e)}
+    finally:
+        if controlador is not None:
+            controlador.libertar(erro)
+        if proprio:
+            ydls.fechar()
+
+    if estagio is None:
+        return post_process_content(info, format_choice, title, ext, idx, total, diario)
+    else:
+        estagio.submeter(info, format_choice, title, ext, idx, total, diario)
 
 if __name__ == "__main__":
     try:
         create_download_dir()
         if not check_ffmpeg():
             raise RuntimeError("FFmpeg não encontrado. Instale e configure corretamente.")
+        cache = CacheMetadados(os.path.join(DOWNLOAD_DIR, CACHE_METADADOS), ttl=CACHE_TTL)
         while True:
             print("Insira os links do YouTube (um por linha). Digite uma linha vazia para finalizar:")
             links = []
@@ -147,36 +232,52 @@ if __name__ == "__main__":
                 print("Opção inválida.")
                 continue
             format_choice = 'mp3' if format_choice == '1' else 'mp4'
-            # Expande playlists para vídeos individuais
-            all_video_links = []
-            for link in links:
-                try:
-                    type_, uri = parse_youtube_link(link)
-                    if type_ == 'playlist':
-                        print(f"Extraindo vídeos da playlist: {uri}")
-                        videos = get_playlist_videos(uri)
-                        if videos:
-                            all_video_links.extend(videos)
-                        else:
-                            print(f"Nenhum vídeo encontrado na playlist: {uri}")
-                    else:
-                        all_video_links.append(uri)
-                except Exception as e:
-                    print(f"Link ignorado: {link} - {e}")
-            # Remove duplicados finais
-            all_video_links = list(dict.fromkeys(all_video_links))
-            total = len(all_video_links)
-            if total == 0:
-                print("Nenhum vídeo válido para download.")
-                continue
-            print(f"Iniciando downloads simultâneos ({min(20, total)} por vez)...")
-            with ThreadPoolExecutor(max_workers=20) as executor:
-                futures = []
-                for idx, url in enumerate(all_video_links, 1):
-                    futures.append(executor.submit(download_youtube_content, url, format_choice, idx, total))
-                for future in as_completed(futures):
-                    pass
-            print("Todos os downloads finalizados!")
+            registo = RegistoResultados(os.path.join(DOWNLOAD_DIR, REGISTO_RESULTADOS))
+            estagio = EstagioPosProcessamento(post_process_content, ao_terminar=registo)
+            controlador = ControladorConcorrencia(
+                maximo=MAX_WORKERS, inicial=WORKERS_INICIAIS, backlog=estagio.pendentes)
+            # Diário do lote (mesmos links + formato = mesmo lote): retoma execuções interrompidas
+            lote = hashlib.blake2b('\n'.join([format_choice] + links).encode('utf-8'), digest_size=6).hexdigest()
+            diario = DiarioLote(os.path.join(DOWNLOAD_DIR, DIARIO_LOTE.format(lote)))
+            if len(diario):
+                print(f"A retomar o lote anterior: {diario.resumo()}")
+            ydls = YoutubeDLPorThread(download_options(format_choice, controlador, diario))
+            # Itens já descarregados na execução anterior vão diretos para o ffmpeg
+            retomados = set()
+            for item in diario.por_pos_processar():
+                retomados.add(item['chave'])
+                estagio.submeter(item['info'], format_choice, item.get('titulo'), format_choice,
+                                 item.get('indice'), '?', diario)
+            if retomados:
+                print(f"{len(retomados)} itens retomados diretamente na conversão.")
+            print(f"Iniciando downloads simultâneos (adaptativo, até {MAX_WORKERS} por vez)...")
+            def trabalhos():
+                # Playlists expandidas aos poucos: os downloads começam logo com a primeira
+                # página e a paginação só avança quando há vaga para mais trabalhos
+                for idx, url in enumerate(expand_links(links, cache), 1):
+                    chave = chave_canonica(url)
+                    if diario.estado(chave) == 'concluido' or chave in retomados:
+                        continue
+                    diario.marcar(chave, 'em_fila', url=url, indice=idx)
+                    yield partial(download_youtube_content, url, format_choice, idx, '?',
+                                  controlador, estagio, cache, ydls, diario)
+
+            # No máximo 2 × MAX_WORKERS trabalhos submetidos de cada vez
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                # Os erros de download também vão para o registo (os itens em conversão chegam pelo estagio)
+                submeter_limitado(executor, trabalhos(), 2 * MAX_WORKERS,
+                                  lambda resultado: resultado and registo(resultado))
+            ydls.fechar()
+            estagio.fechar()
+            YDL_POS_PROCESSAMENTO.fechar()
+            diario.fechar()
+            registo.fechar()
+            if not sum(registo.contagem.values()):
+                print("Nenhum vídeo novo para download.")
+            print(f"Todos os downloads finalizados! {registo.contagem['ok']} concluídos, "
+                  f"{registo.contagem['error']} com erro (ver {REGISTO_RESULTADOS}).")
+            print(f"Concorrência: {controlador.resumo()}")
+            print(f"Deduplicação: {ARMAZEM.resumo()}")
             # Menu ao final
             print("\nO que deseja fazer agora?")
             print("[1] Fazer mais downloads")
@@ -184,6 +285,7 @@ if __name__ == "__main__":
             escolha = input("Escolha uma opção: ").strip()
             if escolha == '2':
                 print("Saindo...")
+                ARMAZEM.fechar()
                 break
     except Exception as e:
         print(f"Erro: {e}")
\ No newline at end of file
@@ -1,14 +1,38 @@
 import os
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import hashlib
+import threading
+from datetime import datetime
+from functools import partial
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
 from tqdm import tqdm
 from pathlib import Path
+from util_downloads import (ArmazemConteudo, CacheMetadados, ControladorConcorrencia, DiarioLote,
+                            EstagioPosProcessamento, RegistoResultados, YoutubeDLPorThread,
+                            calcular_checksum, chave_canonica, chave_info, descarregar_com_cache,
+                            comparar_politicas, destino_sem_formato, estimador_custo,
+                            expandir_playlist, juntar_em_mp4, ler_jsonl, ordenar_trabalhos,
+                            reescrever_jsonl, resumir_info, submeter_limitado)
 
 # Configurações
 CONCURRENCY = 60  # número máximo de downloads simultâneos
+CONCURRENCY_INICIAL = 8  # ponto de partida do controlo adaptativo
 RETRIES = 3       # número de tentativas por vídeo
+ARQUIVO_INDICE = '.arquivo_downloads.jsonl'  # índice dos vídeos já baixados (na pasta de saída)
+CACHE_METADADOS = '.cache_metadados.sqlite3'  # info dicts do yt_dlp (na pasta de saída)
+CACHE_TTL = 3 * 3600  # segundos; as URLs dos formatos do YouTube expiram ao fim de ~6h
+DIARIO_LOTE = '.lote_{}.jsonl'  # estado de cada vídeo da playlist, para retomar (na pasta de saída)
+REGISTO_RESULTADOS = '.resultados.jsonl'  # resultados da última execução (na pasta de saída)
+# Ordem dos downloads: 'ordem' (da playlist), 'sjf' (curtos primeiro), 'ljf' (longos
+# primeiro, menor cauda no fim) ou 'rr' (intercala tamanhos). Fora de 'ordem' a playlist
+# é reordenada em janelas de JANELA_AGENDAMENTO vídeos, lidas à medida que são precisas.
+# O makespan de cada política é mostrado antes (ou, em 'ordem', no fim) sobre a 1.ª janela.
+POLITICA_AGENDAMENTO = 'ordem'
+JANELA_AGENDAMENTO = 500
 
 
 def get_download_folder():
@@ -21,9 +45,57 @@ def get_download_folder():
     return downloads
 
 
-def fetch_playlist_entries(playlist_url):
+class IndiceArquivo:
     """
-    Obtém os vídeos da playlist (sem baixar ainda).
+    Índice persistente (JSON Lines) dos vídeos já descarregados:
+    ID do vídeo → caminho, tamanho, checksum e data de conclusão.
+    Consultado antes de submeter trabalho, para não voltar a sondar cada URL.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.registos = {}
+        linhas = 0
+        for registo in ler_jsonl(caminho):
+            self.registos[registo['id']] = registo
+            linhas += 1
+        if linhas > 2 * len(self.registos) + 100:
+            self._compactar()
+
+    def _compactar(self):
+        reescrever_jsonl(self.caminho, self.registos.values())
+
+    def concluido(self, video_id):
+        """
+        True se o vídeo já foi baixado e o ficheiro continua no disco com o mesmo tamanho.
+        """
+        registo = self.registos.get(video_id)
+        if not registo:
+            return False
+        try:
+            return os.path.getsize(registo['caminho']) == registo['tamanho']
+        except OSError:
+            return False
+
+    def registar(self, video_id, caminho):
+        registo = {
+            'id': video_id,
+            'caminho': str(caminho),
+            'tamanho': os.path.getsize(caminho),
+            'checksum': calcular_checksum(caminho),
+            'concluido': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self.lock:
+            self.registos[video_id] = registo
+            with open(self.caminho, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(registo, ensure_ascii=False) + '\n')
+
+
+def fetch_playlist_entries(playlist_url, cache=None):
+    """
+    Gera os vídeos da playlist (sem baixar ainda) à medida que as páginas
+    chegam, ou da CacheMetadados se possível.
     """
     ydl_opts = {
         'extract_flat': 'in_playlist',
@@ -32,10 +104,7 @@ def fetch_playlist_entries(playlist_url):
         'skip_download': True,
     }
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(playlist_url, download=False)
-    if not info:
-        return []
-    return info.get('entries', [info])
+        yield from expandir_playlist(ydl, playlist_url, cache)
 
 
 def build_video_url(entry):
@@ -51,35 +120,116 @@ def build_video_url(entry):
     return None
 
 
-def download_video(video_url, outdir, index, total):
+# YoutubeDL (só para o ffmpeg) de cada worker do EstagioPosProcessamento
+YDL_POS_PROCESSAMENTO = YoutubeDLPorThread({'quiet': True, 'no_warnings': True})
+# Deduplicação por conteúdo (hardlinks), partilhada com os outros downloaders
+ARMAZEM = ArmazemConteudo()
+
+
+def pos_processar(info, video_url, arquivo=None, video_id=None, diario=None):
     """
-    Faz o download de um único vídeo com áudio e vídeo combinados (via ffmpeg).
+    Etapa de CPU: junta vídeo + áudio num mp4 (cópia de streams sempre que
+    os codecs o permitem), troca-o por um hardlink se o conteúdo já existir
+    noutro ficheiro e regista-o no IndiceArquivo e no DiarioLote, se forem dados.
     """
-    outtmpl = os.path.join(outdir, f"{index:03d} - %(title).100s.%(ext)s")
+    try:
+        destino = destino_sem_formato(info, 'mp4')
+        caminho, plano, segundos = juntar_em_mp4(YDL_POS_PROCESSAMENTO.obter(), info, destino)
+        ARMAZEM.registar(caminho)
+        if arquivo is not None and video_id:
+            arquivo.registar(video_id, caminho)
+        if diario is not None:
+            diario.marcar(chave_info(info), 'concluido', ficheiro=caminho)
+        return {'status': 'ok', 'url': video_url, 'ficheiro': os.path.basename(caminho),
+                'plano': plano, 'segundos': segundos}
+    except Exception as e:
+        if diario is not None:
+            diario.marcar(chave_info(info), 'falhou', erro=str(e))
+        return {'status': 'error', 'url': video_url, 'error': str(e)}
+
+
+def opcoes_download(outdir, controlador=None, diario=None):
+    """
+    Opções do YoutubeDL da etapa de rede. São as mesmas para todos os vídeos:
+    o número do vídeo entra pelo extra_info ('%(indice)03d').
+    """
+    # Cada faixa num ficheiro próprio (.f<format_id>); o merge fica para a etapa de CPU
+    outtmpl = os.path.join(outdir, "%(indice)03d - %(title).100s.f%(format_id)s.%(ext)s")
 
     ydl_opts = {
-        # Garante o melhor vídeo + melhor áudio e faz merge automático
-        'format': 'bestvideo+bestaudio/best',
-        'merge_output_format': 'mp4',   # saída final com áudio + vídeo juntos
+        # Melhor vídeo e melhor áudio em separado (ou o melhor formato combinado)
+        'format': 'bestvideo,bestaudio/best',
         'outtmpl': outtmpl,
         'quiet': True,
         'noplaylist': True,
         'continuedl': True,
         'no_warnings': True,
         'retries': RETRIES,
-        # parâmetros de pós-processamento (ffmpeg faz o merge)
-        'postprocessors': [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp4',
-        }],
     }
+    ydl_opts['progress_hooks'] = [objeto.hook_progresso for objeto in (controlador, diario)
+                                  if objeto is not None]
+    return ydl_opts
+
 
+def download_video(video_url, outdir, index, total, arquivo=None, video_id=None,
+                   controlador=None, estagio=None, cache=None, ydls=None, diario=None):
+    """
+    Descarrega as faixas de vídeo e áudio de um único vídeo (só rede).
+    O merge com ffmpeg é feito por pos_processar(): no EstagioPosProcessamento,
+    se for dado, ou logo a seguir nesta thread. Com um ControladorConcorrencia,
+    espera por vaga e reporta débito e erros; com uma CacheMetadados, evita
+    voltar a extrair os metadados do vídeo. `ydls` (YoutubeDLPorThread) dá o
+    YoutubeDL reutilizado da thread; sem ele é criado um só para este vídeo.
+    Com um DiarioLote, cada mudança de estado fica registada para poder retomar.
+    """
+    proprio = ydls is None
+    if proprio:
+        ydls = YoutubeDLPorThread(opcoes_download(outdir, controlador, diario))
+
+    if controlador is not None:
+        controlador.adquirir()
+
+    erro = None
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
-        return {'status': 'ok', 'url': video_url}
+        if diario is not None:
+            diario.marcar(chave_canonica(video_url), 'a_descarregar')
+        ydl = ydls.obter()
+        info = descarregar_com_cache(ydl, video_url, cache, extra_info={'indice': index})
+        if diario is not None:
+            diario.marcar(chave_info(info), 'pos_processamento', info=resumir_info(ydl, info))
     except Exception as e:
+        erro = e
+        if diario is not None:
+            diario.marcar(chave_canonica(video_url), 'falhou', erro=str(e))
         return {'status': 'error', 'url': video_url, 'error': str(e)}
+    finally:
+        if controlador is not None:
+            controlador.libertar(erro)
+        if proprio:
+            ydls.fechar()
+
+    if estagio is None:
+        return pos_processar(info, video_url, arquivo, video_id, diario)
+    # Bloqueia se a fila de ffmpeg estiver cheia (a vaga de rede já foi libertada)
+    estagio.submeter(info, video_url, arquivo, video_id, diario)
+    return {'status': 'queued', 'url': video_url}
+
+
+def mostrar_makespans(janela, custo_item, workers):
+    """
+    Compara o makespan simulado de cada política sobre uma janela de vídeos
+    pendentes com o ideal: nenhum worker acaba antes de sum/workers nem antes
+    do maior vídeo.
+    """
+    custos = [custo_item(item) for item in janela]
+    ideal = max(sum(custos) / workers, max(custos))
+    print(f"📊 Makespan estimado ({len(janela)} vídeos, {workers} downloads simultâneos; "
+          f"tamanho no worker mais carregado):")
+    for politica, makespan in comparar_politicas(janela, custo_item, workers).items():
+        marca = "  ← em uso" if politica == POLITICA_AGENDAMENTO else ""
+        print(f"   {politica:<6} {makespan / 2**20:10.1f} MiB "
+              f"(+{(makespan / ideal - 1) * 100 if ideal else 0:.1f}% do ideal){marca}")
+    print()
 
 
 def main():
@@ -98,41 +248,148 @@ def main():
 
     # Obter entradas
     print("🔍 A verificar a playlist...")
-    entries = fetch_playlist_entries(playlist_url)
-    if not entries:
-        print("❌ Não foi possível extrair a playlist. Confirma a URL.")
-        sys.exit(1)
-
-    total = len(entries)
-    print(f"✅ Playlist com {total} vídeos encontrada.\n")
+    cache = CacheMetadados(os.path.join(outdir, CACHE_METADADOS), ttl=CACHE_TTL)
+    entries = fetch_playlist_entries(playlist_url, cache)
+    arquivo = IndiceArquivo(os.path.join(outdir, ARQUIVO_INDICE))
+    lote = hashlib.blake2b(playlist_url.encode('utf-8'), digest_size=6).hexdigest()
+    diario = DiarioLote(os.path.join(outdir, DIARIO_LOTE.format(lote)))
+    if len(diario):
+        print(f"↩️  A retomar o lote anterior: {diario.resumo()}\n")
 
     # Baixar vídeos em paralelo
     start_time = time.time()
-    results = []
+    # Os resultados vão para disco à medida que chegam; em memória só os contadores
+    registo = RegistoResultados(os.path.join(outdir, REGISTO_RESULTADOS))
+    # Etapa de CPU: um ffmpeg por núcleo, alimentado por uma fila limitada
+    estagio = EstagioPosProcessamento(pos_processar, ao_terminar=registo)
+    controlador = ControladorConcorrencia(
+        maximo=CONCURRENCY, inicial=CONCURRENCY_INICIAL, backlog=estagio.pendentes)
+    # Um YoutubeDL por thread do executor, reutilizado de vídeo para vídeo
+    ydls = YoutubeDLPorThread(opcoes_download(str(outdir), controlador, diario))
 
-    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
-        futures = []
+    # Vídeos já descarregados na execução anterior vão diretos para o ffmpeg
+    retomados = set()
+    for item in diario.por_pos_processar():
+        retomados.add(item['chave'])
+        video_url = item.get('url') or item['info'].get('webpage_url')
+        estagio.submeter(item['info'], video_url, arquivo, item.get('video_id'), diario)
+    if retomados:
+        print(f"🎞️  {len(retomados)} vídeos retomados diretamente no pós-processamento.\n")
+
+    contagem = {'total': 0, 'ja_baixados': 0}
+
+    def pendentes():
+        # Gerador: a playlist só é paginada à medida que há vaga para mais trabalhos
         for i, entry in enumerate(entries, 1):
+            contagem['total'] = i
             video_url = build_video_url(entry)
             if not video_url:
                 continue
-            futures.append(executor.submit(
-                download_video, video_url, str(outdir), i, total))
+            chave = chave_canonica(video_url)
+            if arquivo.concluido(entry.get('id')) or diario.estado(chave) == 'concluido':
+                contagem['ja_baixados'] += 1
+                continue
+            if chave not in retomados:
+                yield i, entry, video_url, chave
 
-        for f in tqdm(as_completed(futures), total=len(futures), desc="⬇️  A descarregar"):
-            results.append(f.result())
+    def janelas(itens):
+        # Só JANELA_AGENDAMENTO entradas em memória de cada vez, cada janela com a sua estimativa
+        while True:
+            janela = list(islice(itens, JANELA_AGENDAMENTO))
+            if not janela:
+                return
+            custo = estimador_custo([entry for _, entry, _, _ in janela])
+            yield janela, lambda item, custo=custo: custo(item[1])
+
+    itens = pendentes()
+    workers = controlador.limite
+    amostra = []  # em 'ordem': a 1.ª janela, guardada à passagem para o relatório no fim
+    if POLITICA_AGENDAMENTO != 'ordem':
+        grupos = janelas(itens)
+        primeira = next(grupos, None)
+        if primeira:
+            mostrar_makespans(*primeira, workers)
+            grupos = chain([primeira], grupos)
+        itens = (item for janela, custo_item in grupos
+                 for item in ordenar_trabalhos(janela, POLITICA_AGENDAMENTO, custo_item))
+    else:
+        def amostrar(itens):
+            # Sem atrasar o arranque: os itens seguem logo para o pool
+            for item in itens:
+                if len(amostra) < JANELA_AGENDAMENTO:
+                    amostra.append(item)
+                yield item
+        itens = amostrar(itens)
+
+    def trabalhos():
+        for i, entry, video_url, chave in itens:
+            video_id = entry.get('id')
+            diario.marcar(chave, 'em_fila', url=video_url, video_id=video_id, indice=i)
+            yield partial(download_video, video_url, str(outdir), i, None, arquivo, video_id,
+                          controlador=controlador, estagio=estagio, cache=cache, ydls=ydls, diario=diario)
+
+    barra = tqdm(desc="⬇️  A descarregar", unit=" vídeos")
+
+    def terminado(r):
+        barra.update()
+        if r['status'] != 'queued':
+            registo(r)
+
+    # O executor tem CONCURRENCY threads, mas só `controlador.limite` descarregam ao mesmo tempo;
+    # ficam no máximo 2 × CONCURRENCY trabalhos submetidos de cada vez.
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        submeter_limitado(executor, trabalhos(), 2 * CONCURRENCY, terminado)
+    barra.close()
+
+    print("🎞️  A terminar o pós-processamento (ffmpeg)...")
+    ydls.fechar()
+    estagio.fechar()
+    YDL_POS_PROCESSAMENTO.fechar()
+    cache.fechar()
+    ARMAZEM.fechar()
+    diario.fechar()
+
+    if not contagem['total'] and not retomados:
+        print("❌ Não foi possível extrair a playlist. Confirma a URL.")
+        sys.exit(1)
+    print(f"\n📋 Playlist com {contagem['total']} vídeos.")
+    if contagem['ja_baixados']:
+        print(f"⏭️  {contagem['ja_baixados']} vídeos já estavam baixados (ver {ARQUIVO_INDICE}).")
 
     elapsed = time.time() - start_time
-    ok = sum(1 for r in results if r.get('status') == 'ok')
-    err = sum(1 for r in results if r.get('status') != 'ok')
+    ok = registo.contagem['ok']
+    err = sum(registo.contagem.values()) - ok
 
     print(
-        f"\n✅ Concluído em {elapsed:.1f}s — {ok} vídeos baixados / {err} falhas.\n")
+        f"\n✅ Concluído em {elapsed:.1f}s — {ok} vídeos baixados / {err} falhas.")
+    print(f"⚙️  Concorrência adaptativa: {controlador.resumo()}")
+    print(f"♻️  Deduplicação: {ARMAZEM.resumo()}\n")
+    if amostra:
+        mostrar_makespans(*next(janelas(iter(amostra))), workers)
+
+    # O registo é lido do disco, uma linha de cada vez
+    copias = recodificados = 0
+    segundos_recodificar = 0.0
+    for r in registo.ler():
+        if 'plano' not in r:
+            continue
+        if not copias + recodificados:
+            print("🎞️  Pós-processamento por ficheiro:")
+        print(f"   {r['segundos']:7.2f}s  {r['plano']:<38}  {r['ficheiro']}")
+        if '→' in r['plano']:
+            recodificados += 1
+            segundos_recodificar += r['segundos']
+        else:
+            copias += 1
+    if copias + recodificados:
+        print(f"   {copias} só com cópia de streams, {recodificados} recodificados "
+              f"({segundos_recodificar:.1f}s de ffmpeg a recodificar).\n")
     if err:
         print("❗ Erros detectados:")
-        for r in results:
+        for r in registo.ler():
             if r['status'] == 'error':
                 print("-", r['url'], "→", r['error'])
+    registo.fechar()
 
 
 if __name__ == "__main__":
@@ -1,38 +1,209 @@
 import instaloader
 import concurrent.futures
+import json
 import os
+import threading
+import time
 from urllib.parse import urlparse
+from util_downloads import ArmazemConteudo, ler_jsonl
+
+# Configurações
+USUARIO_INSTAGRAM = None  # com login: usa o ficheiro de sessão do instaloader (criado com `instaloader -l USUARIO`)
+FICHEIRO_COOKIES = ".sessao_instagram.json"  # cookies da sessão anónima, reaproveitados entre execuções
+PEDIDOS_POR_MINUTO = 20  # ritmo sustentado de consultas à API do Instagram
+RAJADA_PEDIDOS = 6       # consultas seguidas permitidas depois de um período parado
+ESPERA_429 = 30.0        # segundos de pausa no primeiro 429 (duplica a cada 429 seguido)
+ESPERA_MAXIMA_429 = 600.0
+INDICE_REELS = ".indice_reels.jsonl"  # shortcode -> ficheiro, dentro da pasta de downloads
+
+# Limitador de pedidos
+
+
+class LimitadorPedidos(instaloader.RateController):
+    """
+    Token bucket global para as consultas à API do Instagram, partilhado por
+    todos os workers (o Instaloader é um só, ver SessaoInstagram).
+    Cada consulta gasta uma ficha; as fichas repõem-se a PEDIDOS_POR_MINUTO
+    até RAJADA_PEDIDOS. Depois da ficha aplicam-se ainda as janelas por tipo
+    de consulta do próprio instaloader (ex.: 200 graphql em 11 min, 199
+    'iphone' em 30 min), que o balde sozinho deixaria ultrapassar.
+    Um 429 esvazia o balde e suspende as consultas com backoff exponencial;
+    sem 429 durante ESPERA_MAXIMA_429 o backoff volta ao início.
+    """
+
+    def __init__(self, context, por_minuto=PEDIDOS_POR_MINUTO, rajada=RAJADA_PEDIDOS,
+                 espera_429=ESPERA_429, espera_maxima=ESPERA_MAXIMA_429):
+        super().__init__(context)
+        self.taxa = por_minuto / 60.0
+        self.rajada = rajada
+        self.espera_429 = espera_429
+        self.espera_maxima = espera_maxima
+        self.lock = threading.Lock()
+        self.fichas = float(rajada)
+        self.reposto_em = time.monotonic()
+        self.suspenso_ate = 0.0
+        self.ultimo_429 = None
+        self.seguidos_429 = 0
+
+    def wait_before_query(self, query_type):
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                if agora > self.reposto_em:
+                    self.fichas = min(self.rajada, self.fichas + (agora - self.reposto_em) * self.taxa)
+                    self.reposto_em = agora
+                if self.ultimo_429 is not None and agora - self.ultimo_429 > self.espera_maxima:
+                    self.seguidos_429 = 0
+                espera = self.suspenso_ate - agora
+                if espera <= 0:
+                    if self.fichas >= 1:
+                        self.fichas -= 1
+                        break
+                    espera = (1 - self.fichas) / self.taxa
+            self.sleep(espera)
+        super().wait_before_query(query_type)
+
+    def handle_429(self, query_type):
+        # O instaloader repete a consulta a seguir, passando outra vez por wait_before_query
+        with self.lock:
+            agora = time.monotonic()
+            espera = min(self.espera_429 * 2 ** self.seguidos_429, self.espera_maxima)
+            self.seguidos_429 += 1
+            self.ultimo_429 = agora
+            self.fichas = 0.0
+            self.suspenso_ate = max(self.suspenso_ate, agora + espera)
+            self.reposto_em = self.suspenso_ate  # não acumula fichas durante a pausa
+        self._context.error(f"Instagram respondeu 429: consultas suspensas durante {espera:.0f}s.",
+                            repeat_at_end=False)
+
+# Sessão partilhada pelos workers
+
+
+class SessaoInstagram:
+    """
+    Um único Instaloader partilhado por todos os workers: as consultas à API
+    (metadados do post) usam a mesma requests.Session, com keep-alive, cookies
+    e estado do rate limiting. O InstaloaderContext não é thread-safe, por isso
+    essas consultas passam por um lock. A transferência do vídeo corre em
+    paralelo, mas não usa esta sessão: o instaloader abre uma sessão anónima
+    nova para cada ficheiro (InstaloaderContext.get_raw).
+    """
+
+    def __init__(self, usuario=USUARIO_INSTAGRAM, ficheiro_cookies=FICHEIRO_COOKIES):
+        self.usuario = usuario
+        self.ficheiro_cookies = ficheiro_cookies
+        self.lock = threading.Lock()
+        self.L = instaloader.Instaloader(
+            download_pictures=False, download_videos=True, download_comments=False, save_metadata=False,
+            filename_pattern="{shortcode}",  # o ficheiro fica <pasta>/<shortcode>.mp4, sem procurar
+            rate_controller=lambda context: LimitadorPedidos(context))
+        if usuario:
+            try:
+                self.L.load_session_from_file(usuario)
+            except FileNotFoundError:
+                print(f"Sessão de {usuario} não encontrada; a continuar sem login.")
+                self.usuario = None
+        if not self.usuario and ficheiro_cookies:
+            try:
+                with open(ficheiro_cookies, 'r', encoding='utf-8') as f:
+                    self.L.context.update_cookies(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+    def obter_post(self, shortcode):
+        with self.lock:
+            post = instaloader.Post.from_shortcode(self.L.context, shortcode)
+            post.video_url  # obriga a ler os metadados completos ainda dentro do lock
+        return post
+
+    def descarregar(self, post, output_dir):
+        return self.L.download_post(post, target=output_dir)
+
+    def fechar(self):
+        """
+        Guarda a sessão (cookies) para a próxima execução e fecha a ligação.
+        """
+        with self.lock:
+            if self.usuario:
+                self.L.save_session_to_file()
+            elif self.ficheiro_cookies:
+                with open(self.ficheiro_cookies, 'w', encoding='utf-8') as f:
+                    json.dump(self.L.context.save_session(), f)
+            self.L.close()
+
+# Índice dos reels já baixados
+
+
+class IndiceReels:
+    """
+    Índice persistente (JSON Lines) shortcode -> ficheiro dos reels baixados.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.registos = {registo['shortcode']: registo['ficheiro'] for registo in ler_jsonl(caminho)}
+
+    def ficheiro(self, shortcode):
+        """
+        Caminho do reel, se já foi baixado e o ficheiro ainda existe.
+        """
+        filename = self.registos.get(shortcode)
+        if filename and os.path.isfile(filename):
+            return filename
+        return None
+
+    def registar(self, shortcode, filename):
+        with self.lock:
+            self.registos[shortcode] = filename
+            with open(self.caminho, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'shortcode': shortcode, 'ficheiro': filename}) + '\n')
 
 # Função para baixar um único vídeo
 
 
-def download_video(url, output_dir="downloads"):
+def download_video(url, output_dir="downloads", sessao=None, indice=None, armazem=None):
+    propria = sessao is None
+    if propria:
+        sessao = SessaoInstagram(ficheiro_cookies=None)
     try:
-        L = instaloader.Instaloader(
-            download_pictures=False, download_videos=True, download_comments=False, save_metadata=False)
         shortcode = urlparse(url).path.split('/')[2]
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        filename = f"{output_dir}/{shortcode}.mp4"
-        L.download_post(post, target=output_dir)
-        for file in os.listdir(output_dir):
-            if file.startswith(shortcode) and file.endswith('.mp4'):
-                os.rename(os.path.join(output_dir, file), filename)
+        existente = indice.ficheiro(shortcode) if indice is not None else None
+        if existente:
+            print(f"Já baixado: {existente}")
+            return existente
+        post = sessao.obter_post(shortcode)
+        os.makedirs(output_dir, exist_ok=True)
+        # Com filename_pattern="{shortcode}" o instaloader escreve diretamente aqui
+        filename = os.path.join(output_dir, f"{shortcode}.mp4")
+        sessao.descarregar(post, output_dir)
+        if armazem is not None:
+            # O mesmo reel pode já existir noutro nome (ou vindo de outro downloader)
+            armazem.registar(filename)
+        if indice is not None:
+            indice.registar(shortcode, filename)
         print(f"Vídeo baixado: {filename}")
         return filename
     except Exception as e:
         print(f"Erro ao baixar {url}: {str(e)}")
         return None
+    finally:
+        if propria:
+            sessao.fechar()
 
 # Função para baixar vídeos em paralelo
 
 
-def download_videos_concurrently(video_urls):
+def download_videos_concurrently(video_urls, sessao=None, output_dir="downloads"):
+    os.makedirs(output_dir, exist_ok=True)
+    indice = IndiceReels(os.path.join(output_dir, INDICE_REELS))
+    armazem = ArmazemConteudo()
     with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(download_video, url) for url in video_urls]
+        futures = [executor.submit(download_video, url, output_dir, sessao, indice, armazem) for url in video_urls]
         results = [f.result()
                    for f in concurrent.futures.as_completed(futures)]
+    print(f"Deduplicação: {armazem.resumo()}")
+    armazem.fechar()
     return results
 
 # Função principal
@@ -58,7 +229,11 @@ def main():
         return
 
     print("\nIniciando downloads (máximo 4 simultâneos)...")
-    downloaded_files = download_videos_concurrently(video_urls)
+    sessao = SessaoInstagram()
+    try:
+        downloaded_files = download_videos_concurrently(video_urls, sessao)
+    finally:
+        sessao.fechar()
     print("\nDownloads concluídos!")
     for file in downloaded_files:
         if file:
@@ -0,0 +1,923 @@
+# Utilitários partilhados pelos scripts de download (script3.py, script-spotify.py e script_downloader.py)
+
+import filecmp
+import functools
+import hashlib
+import heapq
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from itertools import chain
+from pathlib import Path
+
+MAX_REDIRECIONAMENTOS = 5  # saltos url/url_transparent seguidos em expandir_playlist
+ARMAZEM_CONTEUDO = str(Path.home() / '.conteudo_downloads.sqlite3')  # comum aos três downloaders
+
+
+def e_throttling(erro):
+    """
+    True se o erro indica que o servidor está a limitar pedidos (HTTP 429).
+    """
+    texto = str(erro)
+    return '429' in texto or 'Too Many Requests' in texto
+
+
+class ControladorConcorrencia:
+    """
+    Controlo adaptativo (AIMD) do número de downloads ativos.
+
+    Os workers chamam adquirir() antes de descarregar e libertar() no fim.
+    A cada `intervalo` segundos o limite é reavaliado com base no débito
+    agregado (bytes/s vindos dos progress hooks do yt_dlp):
+      - 429/throttling, taxa de erros acima de `max_erros` ou fila de
+        pós-processamento (ffmpeg) maior que o número de núcleos:
+        o limite cai para metade;
+      - débito a descer mais de 20% face à janela anterior: limite - 1;
+      - débito estável ou a subir e houve workers à espera de vaga: limite + 1.
+    """
+
+    def __init__(self, minimo=2, maximo=60, inicial=8, intervalo=5.0, max_erros=0.2, backlog=None):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.limite = max(minimo, min(inicial, maximo))
+        self.intervalo = intervalo
+        self.max_erros = max_erros
+        self.backlog = backlog or (lambda: 0)  # ex.: EstagioPosProcessamento.pendentes
+        self.nucleos = os.cpu_count() or 1
+
+        self.condicao = threading.Condition()
+        self.ativos = 0
+        self._ultimos_bytes = {}  # ficheiro -> downloaded_bytes já contabilizados
+        self._ultimo_debito = 0.0
+        self._nova_janela(time.monotonic())
+
+    def _nova_janela(self, agora):
+        self._inicio_janela = agora
+        self._bytes = 0
+        self._erros = 0
+        self._throttles = 0
+        self._concluidos = 0
+        self._saturado = False  # alguém esperou por vaga nesta janela
+
+    def adquirir(self):
+        with self.condicao:
+            while self.ativos >= self.limite:
+                self._saturado = True
+                self.condicao.wait(self.intervalo)
+                self._avaliar()
+            self.ativos += 1
+
+    def libertar(self, erro=None):
+        with self.condicao:
+            self.ativos -= 1
+            if erro is None:
+                self._concluidos += 1
+            else:
+                self._erros += 1
+                if e_throttling(erro):
+                    self._throttles += 1
+            self._avaliar()
+            self.condicao.notify_all()
+
+    def hook_progresso(self, d):
+        """
+        progress_hook do yt_dlp: soma os bytes novos de cada ficheiro.
+        """
+        chave = d.get('tmpfilename') or d.get('filename')
+        with self.condicao:
+            if d.get('status') == 'downloading':
+                atual = d.get('downloaded_bytes') or 0
+                self._bytes += max(atual - self._ultimos_bytes.get(chave, 0), 0)
+                self._ultimos_bytes[chave] = atual
+            else:
+                self._ultimos_bytes.pop(chave, None)
+
+    def _avaliar(self):
+        # Chamado com self.condicao adquirida.
+        agora = time.monotonic()
+        duracao = agora - self._inicio_janela
+        if duracao < self.intervalo:
+            return
+        debito = self._bytes / duracao
+        terminados = self._erros + self._concluidos
+        if (self._throttles
+                or (terminados and self._erros / terminados > self.max_erros)
+                or self.backlog() > self.nucleos):
+            self.limite = max(self.minimo, self.limite // 2)
+        elif debito < 0.8 * self._ultimo_debito:
+            self.limite = max(self.minimo, self.limite - 1)
+        elif self._saturado:
+            self.limite = min(self.maximo, self.limite + 1)
+        self._ultimo_debito = debito
+        self._nova_janela(agora)
+        self.condicao.notify_all()
+
+    def resumo(self):
+        return f"limite final {self.limite} (entre {self.minimo} e {self.maximo})"
+
+
+@functools.lru_cache(maxsize=4096)
+def chave_canonica(url):
+    """
+    'Extrator:ID' do URL (ex.: 'Youtube:dQw4w9WgXcQ'), para que youtu.be/…,
+    watch?v=… e outras variantes partilhem a mesma entrada na cache.
+    Sem extrator que reconheça o ID, a chave é o próprio URL.
+    """
+    from yt_dlp.extractor import gen_extractor_classes
+
+    for ie in gen_extractor_classes():
+        if ie.ie_key() != 'Generic' and ie.suitable(url):
+            id_ = ie.get_temp_id(url)
+            if id_:
+                return f"{ie.ie_key()}:{id_}"
+            break
+    return url
+
+
+class CacheMetadados:
+    """
+    Cache em disco (SQLite) dos info dicts do yt_dlp, indexada pela chave canónica.
+    Os dados são guardados como JSON comprimido (zlib). Entradas com mais de
+    `ttl` segundos são descartadas (as URLs dos formatos expiram); acima de
+    `max_entradas` são apagadas as usadas há mais tempo (LRU).
+    """
+
+    def __init__(self, caminho, ttl=3 * 3600, max_entradas=5000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(caminho, check_same_thread=False)
+        with self.lock, self.con:
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS metadados (
+                    chave TEXT PRIMARY KEY,
+                    criado REAL NOT NULL,
+                    usado REAL NOT NULL,
+                    dados BLOB NOT NULL
+                )""")
+            self.con.execute("CREATE INDEX IF NOT EXISTS idx_metadados_usado ON metadados(usado)")
+
+    def obter(self, chave):
+        agora = time.time()
+        with self.lock, self.con:
+            linha = self.con.execute(
+                "SELECT criado, dados FROM metadados WHERE chave = ?", (chave,)).fetchone()
+            if linha is None:
+                return None
+            if agora - linha[0] > self.ttl:
+                self.con.execute("DELETE FROM metadados WHERE chave = ?", (chave,))
+                return None
+            self.con.execute("UPDATE metadados SET usado = ? WHERE chave = ?", (agora, chave))
+        return json.loads(zlib.decompress(linha[1]))
+
+    def guardar(self, chave, info):
+        dados = zlib.compress(json.dumps(info, ensure_ascii=False).encode('utf-8'))
+        agora = time.time()
+        with self.lock, self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO metadados (chave, criado, usado, dados) VALUES (?, ?, ?, ?)",
+                (chave, agora, agora, dados))
+            self.con.execute("""
+                DELETE FROM metadados WHERE chave IN (
+                    SELECT chave FROM metadados ORDER BY usado DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entradas,))
+
+    def remover(self, chave):
+        with self.lock, self.con:
+            self.con.execute("DELETE FROM metadados WHERE chave = ?", (chave,))
+
+    def fechar(self):
+        with self.lock:
+            self.con.close()
+
+
+def extrair_info(ydl, url, cache=None, **kwargs):
+    """
+    ydl.extract_info(url, download=False, **kwargs), consultando primeiro a cache.
+    Devolve (info, True se veio da cache).
+    """
+    if cache is None:
+        return ydl.extract_info(url, download=False, **kwargs), False
+    chave = chave_canonica(url)
+    info = cache.obter(chave)
+    if info is not None:
+        return info, True
+    info = ydl.extract_info(url, download=False, **kwargs)
+    if info:
+        cache.guardar(chave, ydl.sanitize_info(info))
+    return info, False
+
+
+def expandir_playlist(ydl, url, cache=None):
+    """
+    Gerador das entradas de uma playlist à medida que as páginas chegam:
+    com process=False o yt_dlp devolve as entries de forma preguiçosa, por isso
+    o primeiro download pode começar logo após a primeira página.
+    Redirecionamentos (_type 'url'/'url_transparent', ex.: watch?v=…&list=…
+    ou links encurtados) são seguidos até chegar à playlist ou a um vídeo.
+    A lista completa só é guardada na cache depois de totalmente percorrida.
+    """
+    chave = chave_canonica(url)
+    info = cache.obter(chave) if cache is not None else None
+    if info is not None:
+        yield from info.get('entries') or [info]
+        return
+    info = ydl.extract_info(url, download=False, process=False)
+    saltos = 0
+    while info and info.get('_type') in ('url', 'url_transparent'):
+        saltos += 1
+        if saltos > MAX_REDIRECIONAMENTOS:
+            raise RuntimeError(f'Demasiados redirecionamentos ao expandir {url}')
+        info = ydl.extract_info(info['url'], download=False, process=False,
+                                ie_key=info.get('ie_key'))
+    if not info:
+        return
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        yield info
+        return
+    vistas = []
+    for entry in info.get('entries') or []:
+        if entry:
+            vistas.append(entry)
+            yield entry
+    if cache is not None:
+        cache.guardar(chave, ydl.sanitize_info(dict(info, entries=vistas)))
+
+
+def descarregar_com_cache(ydl, url, cache=None, ao_extrair=None, extra_info=None):
+    """
+    Uma só extração por URL: extract_info(process=False) (ou a cache) seguido de
+    process_ie_result(download=True). ao_extrair(info) é chamado entre os dois
+    (ex.: para mostrar o título); extra_info junta campos do trabalho ao info
+    dict (ex.: {'indice': 7} para '%(indice)03d' no outtmpl). Se o download
+    falhar com dados da cache (URLs expiradas), a entrada é descartada e a
+    extração repete-se uma vez.
+    """
+    info, da_cache = extrair_info(ydl, url, cache, process=False)
+    if ao_extrair is not None:
+        ao_extrair(info)
+    try:
+        return ydl.process_ie_result(info, download=True, extra_info=extra_info)
+    except Exception:
+        if not da_cache:
+            raise
+    cache.remover(chave_canonica(url))
+    info, _ = extrair_info(ydl, url, cache, process=False)
+    return ydl.process_ie_result(info, download=True, extra_info=extra_info)
+
+
+class YoutubeDLPorThread:
+    """
+    Uma instância YoutubeDL por thread, criada no primeiro uso e reutilizada
+    em todos os trabalhos seguintes dessa thread: extratores, handlers HTTP
+    (ligações keep-alive) e cookies são inicializados uma vez por worker e não
+    uma vez por vídeo. O que muda de trabalho para trabalho vai no extra_info
+    (ver descarregar_com_cache), não nas opções.
+    """
+
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.instancias = []
+
+    def obter(self):
+        ydl = getattr(self.local, 'ydl', None)
+        if ydl is None:
+            import yt_dlp
+
+            ydl = self.local.ydl = yt_dlp.YoutubeDL(self.opcoes)
+            with self.lock:
+                self.instancias.append(ydl)
+        return ydl
+
+    def fechar(self):
+        with self.lock:
+            for ydl in self.instancias:
+                ydl.close()
+            self.instancias.clear()
+        self.local = threading.local()
+
+
+def chave_info(info):
+    """
+    Chave canónica ('Extrator:ID') a partir de um info dict já extraído.
+    """
+    return f"{info.get('extractor_key')}:{info.get('id')}"
+
+
+# Campos do info dict (e de cada requested_downloads) lidos no pós-processamento:
+# caminhos e formatos das faixas para o merge/extração de áudio, e os metadados
+# que o FFmpegMetadataPP escreve no ficheiro.
+CAMPOS_POS_PROCESSAMENTO = (
+    'id', 'extractor', 'extractor_key', 'webpage_url', 'original_url',
+    'filepath', 'format_id', 'ext', 'acodec', 'vcodec',
+    'title', 'track', 'artist', 'creator', 'uploader', 'uploader_id', 'album',
+    'album_artist', 'genre', 'track_number', 'disc_number', 'upload_date',
+    'release_date', 'description', 'chapters',
+)
+
+
+def _campos_pos_processamento(info):
+    resumo = {campo: info[campo] for campo in CAMPOS_POS_PROCESSAMENTO
+              if info.get(campo) is not None}
+    # Só as miniaturas já escritas em disco (as que o EmbedThumbnailPP usa)
+    miniaturas = [{'id': t.get('id'), 'filepath': t['filepath']}
+                  for t in info.get('thumbnails') or [] if t.get('filepath')]
+    if miniaturas:
+        resumo['thumbnails'] = miniaturas
+    return resumo
+
+
+def resumir_info(ydl, info):
+    """
+    Info dict serializável só com os campos que o pós-processamento lê
+    (CAMPOS_POS_PROCESSAMENTO), suficiente para o retomar noutra execução.
+    """
+    resumo = _campos_pos_processamento(info)
+    faixas = info.get('requested_downloads')
+    if faixas:
+        resumo['requested_downloads'] = [_campos_pos_processamento(f) for f in faixas]
+    return ydl.sanitize_info(resumo)
+
+
+def ler_jsonl(caminho):
+    """
+    Registos de um ficheiro JSON Lines (nenhum se não existir). A última linha
+    pode estar incompleta se uma execução foi interrompida: é ignorada.
+    """
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    yield json.loads(linha)
+                except json.JSONDecodeError:
+                    continue  # linha incompleta (execução interrompida)
+    except FileNotFoundError:
+        return
+
+
+def reescrever_jsonl(caminho, registos):
+    """
+    Substitui o ficheiro só pelos registos dados (compactação), de forma atómica.
+    """
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        for registo in registos:
+            f.write(json.dumps(registo, ensure_ascii=False) + '\n')
+    os.replace(temporario, caminho)
+
+
+class DiarioLote:
+    """
+    Diário (JSON Lines) do estado de cada item de um lote de downloads, para
+    retomar um lote interrompido: em_fila -> a_descarregar -> pos_processamento
+    -> concluido | falhou. Guarda também os bytes já escritos em cada ficheiro
+    parcial (via progress_hook, no máximo de `intervalo` em `intervalo` segundos
+    por ficheiro) e, ao entrar em pós-processamento, o info dict necessário
+    para o repetir sem voltar a descarregar. Dos itens concluídos só fica a
+    chave (no conjunto `concluidos`), para o lote não crescer com o resto.
+    """
+
+    def __init__(self, caminho, intervalo=2.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.lock = threading.Lock()
+        self.itens = {}          # chave -> estado dos itens ainda por concluir
+        self.concluidos = set()  # chaves dos itens concluídos
+        self._ultimo_registo = {}
+        linhas = 0
+        for evento in ler_jsonl(caminho):
+            self._aplicar(evento)
+            linhas += 1
+        if linhas > 2 * len(self) + 100:
+            self._compactar()
+
+    def __len__(self):
+        return len(self.itens) + len(self.concluidos)
+
+    def _aplicar(self, evento):
+        chave = evento['chave']
+        if evento['estado'] == 'concluido':
+            self.itens.pop(chave, None)
+            self.concluidos.add(chave)
+            return
+        self.concluidos.discard(chave)
+        item = self.itens.setdefault(chave, {'bytes': {}})
+        bytes_ = evento.pop('bytes', None)
+        item.update(evento)
+        if bytes_:
+            item['bytes'].update(bytes_)
+
+    def _compactar(self):
+        concluidos = ({'chave': chave, 'estado': 'concluido'} for chave in self.concluidos)
+        reescrever_jsonl(self.caminho, chain(self.itens.values(), concluidos))
+
+    def _escrever(self, evento):
+        # Chamado com self.lock adquirido.
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(evento, ensure_ascii=False) + '\n')
+        self._aplicar(dict(evento))
+
+    def marcar(self, chave, estado, **dados):
+        with self.lock:
+            self._escrever(dict(dados, chave=chave, estado=estado))
+
+    def estado(self, chave):
+        if chave in self.concluidos:
+            return 'concluido'
+        item = self.itens.get(chave)
+        return item and item['estado']
+
+    def hook_progresso(self, d):
+        """
+        progress_hook do yt_dlp: regista o offset do ficheiro parcial.
+        """
+        info = d.get('info_dict') or {}
+        ficheiro = d.get('tmpfilename') or d.get('filename')
+        if not info.get('id') or not ficheiro:
+            return
+        agora = time.monotonic()
+        with self.lock:
+            if (d.get('status') == 'downloading'
+                    and agora - self._ultimo_registo.get(ficheiro, 0) < self.intervalo):
+                return
+            self._ultimo_registo[ficheiro] = agora
+            self._escrever({'chave': chave_info(info), 'estado': 'a_descarregar',
+                            'bytes': {ficheiro: d.get('downloaded_bytes') or 0}})
+
+    def por_pos_processar(self):
+        """
+        Itens que já foram descarregados mas cujo pós-processamento não terminou.
+        """
+        return [item for item in self.itens.values()
+                if item['estado'] == 'pos_processamento' and item.get('info')]
+
+    def resumo(self):
+        estados = {'concluido': len(self.concluidos)} if self.concluidos else {}
+        for item in self.itens.values():
+            estados[item['estado']] = estados.get(item['estado'], 0) + 1
+        parciais = sum(n for item in self.itens.values() if item['estado'] == 'a_descarregar'
+                       for n in item['bytes'].values())
+        texto = ', '.join(f"{n} {estado}" for estado, n in sorted(estados.items()))
+        return f"{texto or 'vazio'}; {parciais / 2**20:.1f} MiB em ficheiros parciais"
+
+    def fechar(self):
+        """
+        Apaga o diário se tudo terminou bem; senão compacta-o para a próxima execução.
+        """
+        with self.lock:
+            if not self.itens:
+                try:
+                    os.remove(self.caminho)
+                except FileNotFoundError:
+                    pass
+            else:
+                self._compactar()
+
+
+class EstagioPosProcessamento:
+    """
+    Segundo andar do pipeline de download: o trabalho de CPU (ffmpeg) corre
+    num pool próprio com tantos workers quantos núcleos, alimentado por uma
+    fila limitada. Os workers de rede chamam submeter() e, se a fila estiver
+    cheia, ficam à espera em vez de lançarem mais processos ffmpeg.
+
+    `funcao` devolve um dicionário de resultado ({'status': 'ok' | 'error', ...}),
+    que é passado a `ao_terminar` (ex.: um RegistoResultados) ou, sem ele,
+    guardado em memória; fechar() espera que a fila esvazie e devolve essa lista.
+    """
+
+    def __init__(self, funcao, workers=None, tamanho_fila=None, ao_terminar=None):
+        self.funcao = funcao
+        self.ao_terminar = ao_terminar
+        self.workers = workers or os.cpu_count() or 1
+        self.fila = queue.Queue(maxsize=tamanho_fila or 2 * self.workers)
+        self.lock = threading.Lock()
+        self.em_curso = 0
+        self.resultados = []
+        self.threads = [threading.Thread(target=self._trabalhar, daemon=True)
+                        for _ in range(self.workers)]
+        for t in self.threads:
+            t.start()
+
+    def submeter(self, *args):
+        self.fila.put(args)
+
+    def pendentes(self):
+        """
+        Trabalhos à espera na fila mais os que estão a correr (usado como backlog).
+        """
+        return self.fila.qsize() + self.em_curso
+
+    def _trabalhar(self):
+        while True:
+            args = self.fila.get()
+            if args is None:
+                return
+            with self.lock:
+                self.em_curso += 1
+            try:
+                resultado = self.funcao(*args)
+            except Exception as e:
+                resultado = {'status': 'error', 'error': str(e)}
+            with self.lock:
+                self.em_curso -= 1
+                if self.ao_terminar is None:
+                    self.resultados.append(resultado)
+            if self.ao_terminar is not None:
+                self.ao_terminar(resultado)
+
+    def fechar(self):
+        for _ in self.threads:
+            self.fila.put(None)
+        for t in self.threads:
+            t.join()
+        return self.resultados
+
+
+def submeter_limitado(executor, trabalhos, em_voo, ao_terminar):
+    """
+    Submete cada trabalho (função sem argumentos) de `trabalhos` ao executor sem
+    nunca ter mais de `em_voo` futures pendentes. `trabalhos` pode ser um
+    gerador preguiçoso (ex.: a playlist a ser paginada): só avança quando há
+    vaga. Cada resultado é passado a ao_terminar logo que fica pronto.
+    """
+    pendentes = set()
+    for trabalho in trabalhos:
+        if len(pendentes) >= em_voo:
+            feitos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for f in feitos:
+                ao_terminar(f.result())
+        pendentes.add(executor.submit(trabalho))
+    for f in as_completed(pendentes):
+        ao_terminar(f.result())
+
+
+class RegistoResultados:
+    """
+    Resultados de um lote escritos em disco (JSON Lines) à medida que chegam;
+    em memória ficam só os contadores por estado, seja qual for o tamanho da
+    playlist. ler() percorre o ficheiro no fim, sem o carregar todo.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.contagem = Counter()
+        self.f = open(caminho, 'w', encoding='utf-8')
+
+    def __call__(self, resultado):
+        linha = json.dumps(resultado, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.f.write(linha)
+            self.contagem[resultado.get('status')] += 1
+
+    def ler(self):
+        with self.lock:
+            self.f.flush()
+        with open(self.caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                yield json.loads(linha)
+
+    def fechar(self):
+        with self.lock:
+            self.f.close()
+
+
+POLITICAS = ('ordem', 'sjf', 'ljf', 'rr')
+
+
+def estimador_custo(entradas, bytes_por_segundo=500_000):
+    """
+    Função entrada -> custo estimado (bytes) a partir dos campos da extração
+    plana: filesize_approx quando existe, senão duration × o débito típico
+    (mediana dos itens que têm os dois campos, ou `bytes_por_segundo`).
+    Itens sem nenhum dos campos recebem a mediana dos restantes.
+    """
+    razoes = sorted(e['filesize_approx'] / e['duration'] for e in entradas
+                    if e.get('filesize_approx') and e.get('duration'))
+    if razoes:
+        bytes_por_segundo = razoes[len(razoes) // 2]
+
+    def bruto(e):
+        if e.get('filesize_approx'):
+            return float(e['filesize_approx'])
+        if e.get('duration'):
+            return e['duration'] * bytes_por_segundo
+        return None
+
+    conhecidos = sorted(c for c in map(bruto, entradas) if c is not None)
+    mediana = conhecidos[len(conhecidos) // 2] if conhecidos else 1.0
+
+    def custo(e):
+        c = bruto(e)
+        return mediana if c is None else c
+    return custo
+
+
+def ordenar_trabalhos(itens, politica, custo):
+    """
+    Ordem de submissão dos itens segundo a política:
+      ordem - a da playlist;
+      sjf   - mais curtos primeiro (resultados cedo, cauda longa no fim);
+      ljf   - mais longos primeiro (os grandes não ficam para o fim: menor makespan);
+      rr    - intercala os quartis de tamanho (um de cada, à vez).
+    """
+    if politica == 'ordem':
+        return list(itens)
+    por_custo = sorted(itens, key=custo)
+    if politica == 'sjf':
+        return por_custo
+    if politica == 'ljf':
+        return por_custo[::-1]
+    if politica == 'rr':
+        quartis = [por_custo[i * len(por_custo) // 4:(i + 1) * len(por_custo) // 4][::-1]
+                   for i in range(3, -1, -1)]
+        ordem = []
+        while any(quartis):
+            for q in quartis:
+                if q:
+                    ordem.append(q.pop())
+        return ordem
+    raise ValueError(f"Política desconhecida: {politica}")
+
+
+def simular_makespan(custos, workers):
+    """
+    Fim do último trabalho quando `custos` são atribuídos por esta ordem ao
+    primeiro de `workers` que fica livre (mesmas unidades dos custos).
+    """
+    livres = [0.0] * max(workers, 1)
+    for c in custos:
+        heapq.heapreplace(livres, livres[0] + c)
+    return max(livres)
+
+
+def comparar_politicas(itens, custo, workers):
+    """
+    Makespan simulado de cada política, para os mesmos itens e workers.
+    """
+    return {p: simular_makespan([custo(i) for i in ordenar_trabalhos(itens, p, custo)], workers)
+            for p in POLITICAS}
+
+
+def destino_sem_formato(info, ext):
+    """
+    Caminho final de um download feito com '.f%(format_id)s' no outtmpl:
+    'titulo.f137.mp4' -> 'titulo.<ext>'.
+    """
+    faixa = (info.get('requested_downloads') or [info])[0]
+    base = os.path.splitext(faixa['filepath'])[0]
+    return base.removesuffix('.f' + str(faixa.get('format_id'))) + '.' + ext
+
+
+# Codecs (nomes do ffprobe) que o contentor mp4 aceita sem recodificar
+CODECS_MP4 = {
+    'video': {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'},
+    'audio': {'aac', 'mp3', 'opus', 'flac', 'alac', 'ac3', 'eac3'},
+}
+CODIFICADORES_MP4 = {'video': 'libx264', 'audio': 'aac'}
+
+
+def planear_mp4(ff, ficheiros):
+    """
+    Sonda (ffprobe) as faixas descarregadas e decide, stream a stream, se
+    basta copiar para o mp4 ou se é preciso recodificar.
+    Devolve (opções de saída do ffmpeg, True se tudo é cópia, descrição do plano).
+    """
+    opcoes = []
+    plano = {}
+    for i, caminho in enumerate(ficheiros):
+        for stream in ff.get_metadata_object(caminho).get('streams', []):
+            tipo = stream.get('codec_type')
+            if tipo not in CODECS_MP4 or tipo in plano:
+                continue
+            if (stream.get('disposition') or {}).get('attached_pic'):
+                continue  # capa embutida, não é vídeo
+            codec = stream.get('codec_name')
+            copiar = codec in CODECS_MP4[tipo]
+            plano[tipo] = 'cópia' if copiar else f"{codec}→{CODIFICADORES_MP4[tipo]}"
+            letra = tipo[0]
+            opcoes += ['-map', f"{i}:{stream['index']}",
+                       f'-c:{letra}', 'copy' if copiar else CODIFICADORES_MP4[tipo]]
+    so_copia = all(p == 'cópia' for p in plano.values())
+    descricao = ', '.join(f"{tipo}: {p}" for tipo, p in plano.items()) or 'sem streams'
+    return opcoes, so_copia, descricao
+
+
+def juntar_em_mp4(ydl, info, destino):
+    """
+    Junta as faixas descarregadas em separado (formato 'bestvideo,bestaudio')
+    num único mp4. Só recodifica as streams que o mp4 não aceita; um ficheiro
+    único que já é mp4 compatível é apenas renomeado.
+    Devolve (caminho final, descrição do plano, segundos gastos).
+    """
+    from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+
+    ff = FFmpegPostProcessor(ydl)  # respeita o ffmpeg_location do ydl
+    ficheiros = [f['filepath'] for f in info.get('requested_downloads') or [info]]
+    inicio = time.perf_counter()
+    opcoes, so_copia, plano = planear_mp4(ff, ficheiros)
+
+    if so_copia and len(ficheiros) == 1 and ficheiros[0].endswith('.mp4'):
+        os.replace(ficheiros[0], destino)
+        return destino, 'renomeado', time.perf_counter() - inicio
+
+    temporario = os.path.splitext(destino)[0] + '.temp.mp4'
+    ff.real_run_ffmpeg([(f, []) for f in ficheiros], [(temporario, opcoes)])
+    os.replace(temporario, destino)
+    for f in ficheiros:
+        if f != destino:
+            os.remove(f)
+    return destino, plano, time.perf_counter() - inicio
+
+
+def calcular_checksum(caminho, bloco=1 << 20):
+    """
+    BLAKE2b do ficheiro, lido em blocos de 1 MiB.
+    """
+    h = hashlib.blake2b()
+    with open(caminho, 'rb') as f:
+        for parte in iter(lambda: f.read(bloco), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+
+class ArmazemConteudo:
+    """
+    Deduplicação por conteúdo dos ficheiros descarregados (SQLite).
+
+    registar(caminho) compara o ficheiro novo com os já conhecidos: primeiro
+    pelo tamanho e só quando há ficheiros do mesmo tamanho pelo BLAKE2b (os
+    hashes são calculados quando são precisos e ficam guardados junto com o
+    mtime e o inode; se estes mudarem o hash volta a ser calculado). Antes de
+    um duplicado ser substituído por um hardlink para o original, os dois são
+    comparados byte a byte. A ligação à base de dados só é aberta no primeiro uso.
+    """
+
+    def __init__(self, caminho=ARMAZEM_CONTEUDO):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.con = None
+        self.poupado = 0
+        self.duplicados = 0
+
+    def _ligar(self):
+        # Chamado com self.lock adquirido.
+        if self.con is None:
+            self.con = sqlite3.connect(self.caminho, check_same_thread=False)
+            with self.con:
+                self.con.execute("""
+                    CREATE TABLE IF NOT EXISTS ficheiros (
+                        caminho TEXT PRIMARY KEY,
+                        tamanho INTEGER NOT NULL,
+                        hash TEXT,
+                        mtime_ns INTEGER,
+                        inode INTEGER
+                    )""")
+                colunas = {linha[1] for linha in self.con.execute("PRAGMA table_info(ficheiros)")}
+                for coluna in ('mtime_ns', 'inode'):  # bases criadas antes destas colunas
+                    if coluna not in colunas:
+                        self.con.execute(f"ALTER TABLE ficheiros ADD COLUMN {coluna} INTEGER")
+                self.con.execute("CREATE INDEX IF NOT EXISTS idx_ficheiros_tamanho ON ficheiros(tamanho)")
+        return self.con
+
+    def _candidatos(self, caminho, tamanho):
+        with self.lock:
+            con = self._ligar()
+            linhas = con.execute(
+                "SELECT caminho, hash, mtime_ns, inode FROM ficheiros WHERE tamanho = ? AND caminho != ?",
+                (tamanho, caminho)).fetchall()
+            if not linhas:
+                with con:
+                    con.execute("INSERT OR REPLACE INTO ficheiros (caminho, tamanho, hash) VALUES (?, ?, NULL)",
+                                (caminho, tamanho))
+        return linhas
+
+    def registar(self, caminho):
+        """
+        Regista o ficheiro e, se já existir outro com o mesmo conteúdo, troca-o
+        por um hardlink para esse. Devolve o caminho do original (ou o próprio).
+        """
+        caminho = os.path.abspath(caminho)
+        tamanho = os.path.getsize(caminho)
+        candidatos = self._candidatos(caminho, tamanho)
+        if not candidatos:
+            return caminho  # tamanho único: nem é preciso calcular o hash
+
+        # Os hashes são calculados fora do lock (é a parte demorada)
+        meu_hash = calcular_checksum(caminho)
+        conhecidos = {}  # caminho -> (hash, mtime_ns, inode)
+        desaparecidos = []
+        for outro, h, mtime_ns, inode in candidatos:
+            try:
+                st = os.stat(outro)
+                if st.st_size != tamanho:
+                    desaparecidos.append(outro)
+                    continue
+                if (mtime_ns, inode) != (st.st_mtime_ns, st.st_ino):
+                    h = None  # reescrito desde que o hash foi guardado
+                conhecidos[outro] = (h or calcular_checksum(outro), st.st_mtime_ns, st.st_ino)
+            except OSError:
+                desaparecidos.append(outro)
+
+        original = next((o for o, (h, _, _) in conhecidos.items() if h == meu_hash), None)
+        if original is not None and not os.path.samefile(original, caminho):
+            temporario = caminho + '.link'
+            if not filecmp.cmp(original, caminho, shallow=False):
+                original = None  # mudou entre o hash e agora: não arriscar
+            else:
+                try:
+                    os.link(original, temporario)
+                    os.replace(temporario, caminho)
+                except OSError:
+                    original = None  # outro sistema de ficheiros: fica a cópia
+                else:
+                    with self.lock:
+                        self.poupado += tamanho
+                        self.duplicados += 1
+
+        st = os.stat(caminho)
+        with self.lock, self.con:
+            self.con.executemany("DELETE FROM ficheiros WHERE caminho = ?", [(o,) for o in desaparecidos])
+            self.con.executemany("UPDATE ficheiros SET hash = ?, mtime_ns = ?, inode = ? WHERE caminho = ?",
+                                 [(*assinatura, o) for o, assinatura in conhecidos.items()])
+            self.con.execute("INSERT OR REPLACE INTO ficheiros (caminho, tamanho, hash, mtime_ns, inode) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             (caminho, tamanho, meu_hash, st.st_mtime_ns, st.st_ino))
+        return original or caminho
+
+    def resumo(self):
+        return f"{self.duplicados} duplicados trocados por hardlinks ({self.poupado / 2**20:.1f} MiB poupados)"
+
+    def fechar(self):
+        with self.lock:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+
+
+def deduplicar_pasta(pasta, armazem=None):
+    """
+    Passa todos os ficheiros de uma biblioteca já existente pelo ArmazemConteudo.
+    """
+    armazem = armazem or ArmazemConteudo()
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            if nome.startswith('.'):
+                continue  # índices, caches e temporários dos scripts
+            caminho = os.path.join(raiz, nome)
+            if os.path.isfile(caminho) and not os.path.islink(caminho):
+                armazem.registar(caminho)
+    print(armazem.resumo())
+    armazem.fechar()
+
+
+def medir_reutilizacao(urls, n=20):
+    """
+    Custo por item de criar um YoutubeDL por vídeo versus reutilizar um só.
+    Com URLs, cada item faz também extract_info(process=False), o que inclui
+    o arranque das ligações HTTP; sem URLs mede só a construção.
+    """
+    import yt_dlp
+
+    opcoes = {'quiet': True, 'no_warnings': True}
+    itens = [urls[i % len(urls)] for i in range(n)] if urls else [None] * n
+
+    def trabalho(ydl, url):
+        if url:
+            ydl.extract_info(url, download=False, process=False)
+
+    inicio = time.perf_counter()
+    for url in itens:
+        with yt_dlp.YoutubeDL(opcoes) as ydl:
+            trabalho(ydl, url)
+    nova = (time.perf_counter() - inicio) / n
+
+    inicio = time.perf_counter()
+    with yt_dlp.YoutubeDL(opcoes) as ydl:
+        for url in itens:
+            trabalho(ydl, url)
+    reutilizada = (time.perf_counter() - inicio) / n
+
+    print(f"{n} itens{' (com extração)' if urls else ' (só construção)'}")
+    print(f"  YoutubeDL novo por item: {nova * 1000:8.1f} ms/item")
+    print(f"  YoutubeDL reutilizado:   {reutilizada * 1000:8.1f} ms/item")
+    print(f"  poupança:                {(nova - reutilizada) * 1000:8.1f} ms/item")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--medir-reutilizacao":
+        medir_reutilizacao(sys.argv[2:])
+    elif len(sys.argv) > 2 and sys.argv[1] == "--deduplicar":
+        for pasta in sys.argv[2:]:
+            deduplicar_pasta(pasta)